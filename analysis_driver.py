@@ -4,17 +4,31 @@ Dette modul styrer selve analysen og interaktionen med Kubios programmet
 """
 
 import logging
+import re
 import time
+from pathlib import Path
+from typing import Dict, List
+import cv2
 import pytesseract
-from PIL import ImageGrab
+from PIL import Image
 
 import pyautogui
-from pywinauto import Application, Desktop
+import win32gui
 
 
-from config import TITLE_KEYWORD, EXCEL_PATH, PROCESS_NAME
+from config import (EXCEL_PATH, PROCESSING_STABLE_SECONDS,
+                    PROCESSING_START_GRACE, PROCESSING_CALIBRATE_EVERY, TIMEOUT_MARGIN_FACTOR, TIMEOUT_MAX_FACTOR,
+                    DIGIT_SAMPLES_DIR, TESSERACT_DIGITS_CONFIG, FILE_DIALOG_TITLE, STATE_POLL_INTERVAL)
+from digit_ocr import read_digits, get_glyphs
 from file_io import read_edf_list, resolve_edf_paths
-from kubios_control import open_kubios, bring_kubios_to_front, get_pid_by_name
+from kubios_control import open_kubios, bring_kubios_to_front, get_session, is_window_responsive
+from timing_model import get_timing_model
+import tracing
+from window_snapshot import get_snapshot
+from screen_match import locate, match_templates, grab_frame
+from screen_capture import invalidate_frame
+from text_entry import enter_text
+from screen_state import ScreenState, wait_for_state
 
 
 def wait_for_window_closed(window_title_substring: str, hold_closed_seconds: float = 6.0,
@@ -31,8 +45,7 @@ def wait_for_window_closed(window_title_substring: str, hold_closed_seconds: flo
 
     while time.time() - start_time < timeout:
         try:
-            windows = Desktop(backend='uia').windows()
-            found = any(window_title_substring.lower() in w.window_text().lower() for w in windows)
+            found = bool(get_snapshot().find(window_title_substring))
             now = time.time()
 
             if found:
@@ -45,22 +58,21 @@ def wait_for_window_closed(window_title_substring: str, hold_closed_seconds: flo
                     # First time we noticed it's closed
                     first_closed_time = now
                     logging.debug(f"Window '{window_title_substring}' first detected as closed at {now}")
+                # Window has been closed for some time (hold_closed_seconds=0 returns right away)
+                time_closed = now - first_closed_time
+                if time_closed >= hold_closed_seconds:
+                    logging.info(
+                        f"Window '{window_title_substring}' has been closed for {time_closed:.1f}s (>= {hold_closed_seconds}s)")
+                    return True
                 else:
-                    # Window has been closed for some time
-                    time_closed = now - first_closed_time
-                    if time_closed >= hold_closed_seconds:
-                        logging.info(
-                            f"Window '{window_title_substring}' has been closed for {time_closed:.1f}s (>= {hold_closed_seconds}s)")
-                        return True
-                    else:
-                        logging.debug(
-                            f"Window '{window_title_substring}' closed for {time_closed:.1f}s, waiting for {hold_closed_seconds}s total")
+                    logging.debug(
+                        f"Window '{window_title_substring}' closed for {time_closed:.1f}s, waiting for {hold_closed_seconds}s total")
 
         except Exception as e:
             logging.error(f"Exception while checking window status: {e}")
             return False
 
-        time.sleep(retry_interval)
+        tracing.sleep(retry_interval)
 
     # Timeout reached
     if first_closed_time is None:
@@ -71,122 +83,324 @@ def wait_for_window_closed(window_title_substring: str, hold_closed_seconds: flo
         logging.warning(
             f"Timeout: Window '{window_title_substring}' was closed for {time_closed:.1f}s but didn't reach {hold_closed_seconds}s within {timeout}s timeout")
         return False
-def detect_open_data_file():
+class ProcessingWaitStats:
+    """Hvor lang tid wait_for_processing_done har ventet, og hvor meget det sparede i forhold til 6 s hold"""
+
+    def __init__(self):
+        self.waits = 0
+        self.seconds = 0.0
+        self.saved_seconds = 0.0
+        self.by_step: Dict[str, List[float]] = {}  # step -> [antal, sekunder]
+
+    def record(self, step: str, elapsed: float, saved: float) -> None:
+        self.waits += 1
+        self.seconds += elapsed
+        self.saved_seconds += saved
+        totals = self.by_step.setdefault(step, [0, 0.0])
+        totals[0] += 1
+        totals[1] += elapsed
+
+    def average(self, step: str) -> float | None:
+        """Gennemsnitlig ventetid for step, eller None hvis der ikke er ventet på det endnu"""
+        count, seconds = self.by_step.get(step, (0, 0.0))
+        return seconds / count if count else None
+
+    @property
+    def saved_per_wait(self) -> float:
+        return self.saved_seconds / self.waits if self.waits else 0.0
+
+
+processing_stats = ProcessingWaitStats()
+
+
+def analysis_region():
+    """Kubios' hovedvindue som (left, top, right, bottom), eller None for hele skærmen"""
     try:
-        open_data_file_label = None
-        for analysis_window in range(3):
-            print(f"trying to detect open data file dialog. Try no. {analysis_window+1}")
-            try:
-                open_data_file_label = pyautogui.locateOnScreen("assets/images/read_data_file.png", confidence=0.8)
-                if open_data_file_label is not None:
+        handle = get_session().main_window()
+        if handle:
+            left, top, right, bottom = win32gui.GetWindowRect(handle)
+            if right > left and bottom > top:
+                return max(left, 0), max(top, 0), right, bottom
+    except Exception as e:
+        logging.debug(f"Could not get analysis region: {e}")
+    return None
+
+
+def _frame_signature(bbox) -> int:
+    # Nedskaleret og groft kvantiseret, så anti-aliasing og små farveskift ikke tæller som ændringer
+    small = cv2.resize(grab_frame(bbox), (64, 40), interpolation=cv2.INTER_AREA) >> 3
+    return hash(small.tobytes())
+
+
+QUIET_GAP_STEP = "processing_quiet_gap"  # Længste stille periode før skærmen ændrede sig igen
+
+
+def _stable_interval(model, hold_closed_seconds: float) -> float | None:
+    """
+    Hvor længe analysevinduet skal være uændret før genberegningen regnes for færdig:
+    p99 af de længste stille perioder målt i kalibrerings-ventetider gange margin-faktoren,
+    mindst PROCESSING_STABLE_SECONDS og højst hold_closed_seconds
+    Returnerer None indtil der er målinger nok (så skal der kalibreres)
+    """
+    gap = model.percentile(QUIET_GAP_STEP, 99)
+    if gap is None:
+        return None
+    return min(max(gap * TIMEOUT_MARGIN_FACTOR, PROCESSING_STABLE_SECONDS), hold_closed_seconds)
+
+
+@tracing.traced("processing_wait", step="step")
+def wait_for_processing_done(step: str, window_title_substring: str = "processing",
+                             stable_seconds: float | None = None,
+                             hold_closed_seconds: float = 6.0, timeout: float = 120.0,
+                             poll_interval: float = 0.1) -> bool:
+    """
+    Venter til Kubios er færdig med at behandle: "processing"-vinduet er væk og
+    analysevinduet har været uændret i stable_seconds
+
+    Stabilitet tæller først når behandlingen er set starte ("processing"-vinduet er vist
+    eller skærmen har ændret sig), eller efter PROCESSING_START_GRACE uden tegn på den,
+    så et klik der endnu ikke har startet genberegningen ikke regnes som færdigt.
+    Uden stable_seconds bruges det målte interval (se _stable_interval); hver
+    PROCESSING_CALIBRATE_EVERY'te ventetid venter i stedet hele hold_closed_seconds og
+    registrerer den længste stille periode undervejs
+
+    Hvis skærmen aldrig falder til ro (fx en blinkende markør), returneres som
+    wait_for_window_closed når vinduet har været lukket i hold_closed_seconds
+    Returnerer False ved timeout eller fejl. Timeout tilpasses af timing-modellen under step,
+    som skal være forskellig for hver slags genberegning (fx "processing_sample" og
+    "processing_save"), så de mange korte ventetider ikke giver de lange en for kort timeout
+    """
+    model = get_timing_model()
+    timeout = model.timeout(step, timeout)
+    calibrating = False
+    if stable_seconds is None:
+        stable_seconds = _stable_interval(model, hold_closed_seconds)
+        calibrating = stable_seconds is None or processing_stats.waits % PROCESSING_CALIBRATE_EVERY == 0
+        if calibrating:
+            stable_seconds = hold_closed_seconds
+    start = time.monotonic()
+    bbox = analysis_region()
+    first_signature = None
+    last_signature = None
+    started = False  # "processing"-vinduet er set, eller skærmen har ændret sig siden første poll
+    stable_since = None
+    closed_since = None
+    longest_gap = 0.0
+    snapshot = get_snapshot()
+
+    while time.monotonic() - start < timeout:
+        try:
+            now = time.monotonic()
+            if snapshot.find(window_title_substring):
+                started = True
+                closed_since = None
+                stable_since = None
+                last_signature = None
+            else:
+                if closed_since is None:
+                    closed_since = now
+                signature = _frame_signature(bbox)
+                if first_signature is None:
+                    first_signature = signature
+                if signature != last_signature:
+                    if started and last_signature is not None:
+                        # En stille periode der ikke var slutningen – stabilitets-intervallet skal være længere
+                        longest_gap = max(longest_gap, now - stable_since)
+                    last_signature = signature
+                    stable_since = now
+                started = started or signature != first_signature
+                stable_for = now - stable_since
+                closed_for = now - closed_since
+                waited_for_start = started or now - start >= PROCESSING_START_GRACE
+                if waited_for_start and (stable_for >= stable_seconds or closed_for >= hold_closed_seconds):
+                    elapsed = now - start
+                    # Den gamle metode returnerede tidligst hold_closed_seconds efter vinduet lukkede
+                    saved = max(closed_since - start + hold_closed_seconds - elapsed, 0.0)
+                    processing_stats.record(step, elapsed, saved)
+                    model.record(step, elapsed)
+                    if calibrating:
+                        model.record(QUIET_GAP_STEP, longest_gap)
+                    logging.info(f"Processing done after {elapsed:.1f}s (stable {stable_for:.1f}s of "
+                                 f"{stable_seconds:.1f}s{', calibrating' if calibrating else ''}, "
+                                 f"saved {saved:.1f}s vs. {hold_closed_seconds}s hold)")
                     return True
-                continue
-            except pyautogui.ImageNotFoundException as exc:
-                time.sleep(5)
-                continue
-        return False
+        except Exception as e:
+            logging.error(f"Exception while waiting for processing: {e}")
+            return False
+        tracing.sleep(poll_interval)
 
-    except Exception as e:
-        logging.error(f"Failed to detect analysis window: {e}")
-        return False
+    logging.warning(f"Timeout: processing ({step}) did not finish within {timeout:.0f}s")
+    model.record(step, timeout)
+    return False
 
-def detect_save_dialog():
+
+def wait_for_dialog(title_substring: str, timeout: float = 10.0, step: str | None = None) -> bool:
+    """
+    Venter til et Kubios-vindue med title_substring i titlen er åbent
+    Med step tilpasses timeout af timing-modellen; kun fundne dialoger registreres,
+    da en timeout også kan skyldes en titel der ikke passer (fx et andet sprog)
+    """
+    model = get_timing_model()
+    if step:
+        timeout = model.timeout(step, timeout)
+    snapshot = get_snapshot()
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if snapshot.find(title_substring):
+            if step:
+                model.record(step, time.monotonic() - start)
+            return True
+        tracing.sleep(STATE_POLL_INTERVAL)
+    return False
+
+
+def detect_open_data_file(timeout: float = 15.0) -> bool:
+    # Venter på "åbn datafil"-dialogen; reagerer inden for ét poll-interval
     try:
-        save_dialog_label = None
-        for analysis_window in range(30):
-            print(f"trying to detect save dialog. Try no. {analysis_window+1}")
-            try:
-                save_dialog_label = pyautogui.locateOnScreen("assets/images/save_cancel.png", confidence=0.8)
-                if save_dialog_label is not None:
-                    return True
-                continue
-            except pyautogui.ImageNotFoundException as exc:
-                time.sleep(5)
-                continue
+        return wait_for_state({ScreenState.OPEN_DATA_DIALOG}, timeout, step="open_data_dialog") is not None
+    except Exception as e:
+        logging.error(f"Failed to detect open data file dialog: {e}")
         return False
 
 
+def detect_save_dialog(timeout: float = 150.0) -> bool:
+    try:
+        return wait_for_state({ScreenState.SAVE_DIALOG}, timeout, step="save_dialog") is not None
     except Exception as e:
-        logging.error(f"Failed to detect analysis window: {e}")
+        logging.error(f"Failed to detect save dialog: {e}")
         return False
 
 
-def detect_analysis_window():
-        try:
-            analysis_window_label = None
-            for analysis_window in range(25):
-                print(f"trying to detect analysis window. Try no. {analysis_window}")
-                if detect_analysis_error("error"):  # press enter if error when opening HRV recording
-                    logging.error(f"Error encountered when attempting to open EDF file")
-                    bring_kubios_to_front("kubios", "error")
-                    pyautogui.hotkey('enter')
-                try:
-                    analysis_window_label = pyautogui.locateOnScreen("assets/images/analysis_window.png", confidence=0.8)
-                    if analysis_window_label is not None:
-                        return True
-                    continue
-                except pyautogui.ImageNotFoundException as exc:
-                    time.sleep(5)
-                    continue
-            return False
-
+def _dismiss_open_error(observation) -> None:
+    # Tryk enter hvis Kubios viser en fejl når HRV-optagelsen åbnes
+    if detect_analysis_error("error"):
+        logging.error(f"Error encountered when attempting to open EDF file")
+        bring_kubios_to_front(title_keyword="error")
+        pyautogui.hotkey('enter')
 
-        except Exception as e:
-            logging.error(f"Failed to detect analysis window: {e}")
-            return False
 
+def detect_analysis_window(timeout: float = 125.0) -> bool:
+    try:
+        return wait_for_state({ScreenState.ANALYSIS_WINDOW}, timeout, on_error=_dismiss_open_error,
+                              step="analysis_window") is not None
+    except Exception as e:
+        logging.error(f"Failed to detect analysis window: {e}")
+        return False
 
 
 def detect_analysis_error(error_title: str):
     try:
         error_windows = []
-        for win in Desktop(backend='uia').windows():
-            title = win.window_text()
-            if error_title in title.lower() and win.process_id() == get_pid_by_name(PROCESS_NAME):
-                logging.info(f"Detected error window in title: {title}")
-                win.set_focus()
-                time.sleep(0.3)
-                try:
-                    win.close()
-                    time.sleep(0.3)
-                    logging.info("Closing error window")
-                except Exception as e:
-                    logging.error(f"Could not close window {title} : {e}")
-                error_windows.append(title)
-
+        snapshot = get_snapshot()
+        # Øjebliksbilledet er allerede filtreret på Kubios' PID
+        for win_info in snapshot.find(error_title):
+            title = win_info.title
+            win = win_info.wrapper
+            logging.info(f"Detected error window in title: {title}")
+            win.set_focus()
+            tracing.sleep(0.3)
+            try:
+                win.close()
+                tracing.sleep(0.3)
+                logging.info("Closing error window")
+            except Exception as e:
+                logging.error(f"Could not close window {title} : {e}")
+            error_windows.append(title)
+
+        if error_windows:
+            snapshot.invalidate()
         return bool(error_windows)
     except Exception as e:
         logging.info(f"Could not detect error window: {e}")
         return False
 
 
+@tracing.traced("open_edf_file")
 def open_edf_file(edf_path):
-    #Åbner EDF-filen i Kubios via PyAutoGui og fokuserer det med PyWinAuto
+    #Åbner EDF-filen i Kubios via PyAutoGui; sessionens hovedvindue fokuseres kun hvis det ikke allerede har fokus
     logging.info(f"Opening EDF file {edf_path}")
     try:
-        app = Application(backend="uia").connect(title_re=TITLE_KEYWORD, process=get_pid_by_name(PROCESS_NAME))
-        app.top_window().set_focus()
-        time.sleep(4)
+        session = get_session()
+        handle = session.main_window()
+        if not handle:
+            raise RuntimeError("Kubios' hovedvindue blev ikke fundet")
+        if win32gui.GetForegroundWindow() != handle and not session.bring_to_front():
+            raise RuntimeError("Kubios' hovedvindue kunne ikke fokuseres")
+        # Hovedvinduet skal behandle beskeder før genvejen sendes (i stedet for en fast pause på 4 s)
+        if not is_window_responsive(handle):
+            session.wait_until_ready(reason="open_edf")
 
         pyautogui.hotkey('ctrl', 'o')
-        time.sleep(4)
-        pyautogui.write(str(edf_path), interval=0.015)
-        time.sleep(1)
+        if not wait_for_dialog(FILE_DIALOG_TITLE, timeout=4.0, step="file_dialog"):
+            logging.warning("File dialog not detected, typing the path anyway")
+        enter_text(str(edf_path), fallback_interval=0.015)
         pyautogui.press('enter')
-        time.sleep(2)
+        invalidate_frame()
     except Exception as e:
         logging.error(f"Error opening EDF file: {e}")
         raise
 
 
 
-def read_time_and_length():
-    logging.info("Starting to read time and length with Tesseract-OCR")
-    time.sleep(1)
+_TIME_PATTERN = re.compile(r"^\d{1,3}[:.]\d{2}[:.]\d{2}$")
+MAX_DIGIT_SAMPLES = 20
+
+
+def digit_samples_needed() -> bool:
+    """True indtil der er samlet MAX_DIGIT_SAMPLES udsnit og glyf-skabelonerne er bygget"""
+    if get_glyphs() is not None:
+        return False
+    return len(list(Path(DIGIT_SAMPLES_DIR).glob("*.png"))) < MAX_DIGIT_SAMPLES
+
+
+def _save_digit_sample(gray, text: str, expected: str) -> None:
+    # Gemmer kun udsnit hvor aflæsningen stemmer med EDF-headerens værdi, så en fejllæsning
+    # aldrig bliver en glyf-skabelon (python digit_ocr.py build)
+    if not _TIME_PATTERN.match(text) or text.replace(".", ":") != expected or not digit_samples_needed():
+        return
+    sample_dir = Path(DIGIT_SAMPLES_DIR)
+    sample_dir.mkdir(parents=True, exist_ok=True)
+    existing = list(sample_dir.glob("*.png"))
+    Image.fromarray(gray).save(sample_dir / f"{text.replace(':', '-')}_{len(existing)}.png")
+
+
+def read_digit_field(gray, name: str, expected: str | None = None) -> str:
+    """
+    Læser et tid/længde-felt med glyf-skabelonerne; usikre aflæsninger og aflæsninger
+    der ikke har formen t:mm:ss sendes til Tesseract med kun cifre, kolon og punktum tilladt
+    Med expected (værdien fra EDF-headeren) gemmes udsnittet som glyf-sample hvis aflæsningen stemmer
+    """
+    result = read_digits(gray)
+    if result.certain and _TIME_PATTERN.match(result.text):
+        logging.info(f"{name}: '{result.text}' (glyph, sikkerhed {result.confidence:.2f})")
+        return result.text
+    text = pytesseract.image_to_string(Image.fromarray(gray), config=TESSERACT_DIGITS_CONFIG).strip()
+    reason = "usikker" if not result.certain else "ikke et tidsformat"
+    logging.info(f"{name}: glyph-aflæsning {reason} ('{result.text}', sikkerhed {result.confidence:.2f}, "
+                 f"margin {result.margin:.2f}), Tesseract gav '{text}'")
+    if expected:
+        _save_digit_sample(gray, text, expected)
+    return text
+
+
+def collect_digit_samples(start_str: str, length_str: str) -> None:
+    """
+    Læser tid/længde-felterne for en fil hvor EDF-headeren kendes, så glyf-skabelonerne
+    bygges af krydstjekkede udsnit. Gør intet når der er nok udsnit
+    """
+    if digit_samples_needed():
+        read_time_and_length(expected=(start_str, length_str))
+
+
+@tracing.traced("ocr_attempt")
+def read_time_and_length(expected: tuple[str, str] | None = None):
+    logging.info("Starting to read time and length with OCR")
+    tracing.sleep(1)
 
     try:
-        time_label = pyautogui.locateOnScreen("assets/images/time_label.png", confidence=0.8)
-        length_label = pyautogui.locateOnScreen("assets/images/length_label.png", confidence=0.8)
+        labels = match_templates(["assets/images/time_label.png", "assets/images/length_label.png"])
+        time_label = labels["assets/images/time_label.png"][0] if labels["assets/images/time_label.png"] else None
+        length_label = labels["assets/images/length_label.png"][0] if labels["assets/images/length_label.png"] else None
 
         if not time_label and length_label:
             logging.error("Time or length label not found on screen")
@@ -208,10 +422,10 @@ def read_time_and_length():
             int(length_label.top + length_label.height)
         )
         print(f"OCR_region for time: {time_region}. Length: {length_region}")
-        screenshot_time = ImageGrab.grab(bbox=time_region).convert('L')
-        screenshot_length = ImageGrab.grab(bbox=length_region).convert('L')
-        time_text = pytesseract.image_to_string(screenshot_time).strip()
-        length_text = pytesseract.image_to_string(screenshot_length).strip()
+        # Begge udsnit skæres ud af det samme skærmbillede som labels blev fundet i
+        expected_time, expected_length = expected or (None, None)
+        time_text = read_digit_field(grab_frame(time_region), "Time", expected_time)
+        length_text = read_digit_field(grab_frame(length_region), "Length", expected_length)
 
 
         try:
@@ -227,6 +441,7 @@ def read_time_and_length():
         return None, None
 
 
+@tracing.traced("perform_read", read_all="read_all")
 def perform_read(read_all: bool, start_time: str = None, end_time: str = None):
 
 
@@ -235,11 +450,12 @@ def perform_read(read_all: bool, start_time: str = None, end_time: str = None):
             btn_img = "assets/images/read_all_blue.png"
         else:
             btn_img = "assets/images/read_part_button.png"
-        button = pyautogui.locateOnScreen(btn_img, confidence=0.8)
+        button = locate(btn_img)
         if not button:
             raise RuntimeError(f"Could not find button: {button} in image: {btn_img}")
         pyautogui.click(pyautogui.center(button))
-        time.sleep(2)
+        invalidate_frame()
+        tracing.sleep(2)
 
 
 
@@ -253,47 +469,89 @@ def perform_read(read_all: bool, start_time: str = None, end_time: str = None):
             return False
         try:
             pyautogui.press('tab')
-            pyautogui.write(str(start_time), interval=0.05)
+            enter_text(str(start_time), fallback_interval=0.05)
             pyautogui.press('tab')
-            pyautogui.write(str(end_time), interval=0.05)
+            enter_text(str(end_time), fallback_interval=0.05)
         except Exception as e:
-           logging.error(f"Error when inputting time: {e}")
+            # Tryk ikke OK med et forkert tidsområde
+            logging.error(f"Error when inputting time: {e}")
+            return False
     try:
-        ok_button = pyautogui.locateOnScreen("assets/images/ok_cancel_read_data_file.png", confidence=0.8)
+        ok_button = locate("assets/images/ok_cancel_read_data_file.png")
         if not ok_button:
             raise RuntimeError(f"Could not find ok button: {ok_button} on screen")
         click_center_left(ok_button)
-        time.sleep(0.5)
+        tracing.sleep(0.5)
         return True
     except Exception as e:
         logging.error(f"Could not perform read: {e}")
         return False
 
 
+def settle(step: str, floor: float, poll_interval: float = 0.1) -> float:
+    """
+    Pause efter et klik eller tastetryk, lært pr. trin af timing-modellen under "settle_<step>"
+
+    floor er den faste pause trinnet brugte før og er altid mindsteværdien. Ændrer
+    analysevinduet sig stadig når floor er gået, ventes der til det står stille (højst
+    floor * TIMEOUT_MAX_FACTOR), og tiden indtil da registreres. Pausen forlænges til p95
+    af de registrerede tider, så et trin der jævnligt har brug for mere tid end floor på
+    denne maskine får det, også når ændringen ikke kan ses i analysevinduet
+    Returnerer den ventede tid
+    """
+    model = get_timing_model()
+    name = f"settle_{step}"
+    limit = floor * TIMEOUT_MAX_FACTOR
+    target = min(max(floor, model.percentile(name, 95) or 0.0), limit)
+    start = time.monotonic()
+    bbox = analysis_region()
+    tracing.sleep(max(floor - poll_interval, 0.0))
+    try:
+        previous = _frame_signature(bbox)
+        tracing.sleep(poll_interval)
+        while time.monotonic() - start < limit:
+            signature = _frame_signature(bbox)
+            if signature == previous:
+                break
+            previous = signature
+            tracing.sleep(poll_interval)
+        model.record(name, time.monotonic() - start)
+    except Exception as e:
+        logging.debug(f"Could not check whether the screen settled after {step}: {e}")
+    remaining = target - (time.monotonic() - start)
+    if remaining > 0:
+        tracing.sleep(remaining)
+    return time.monotonic() - start
+
+
 def click_center_left(region):
     x = region.left + region.width // 4
     y = region.top + region.height // 2
     pyautogui.moveTo(x, y)
-    time.sleep(1)
+    settle("click_center_left", 1)
     pyautogui.click(x, y)
+    invalidate_frame()
 
 def click_right_of(region):
     x = region.left + region.width  + 15
     y = region.top + region.height // 2
     pyautogui.moveTo(x, y)
-    time.sleep(0.5)
+    settle("click_right_of", 0.5)
     pyautogui.click(x, y)
+    invalidate_frame()
 
 def click_right_upper(region):
     x = region.left + region.width + 15
     y = region.top + region.height // 4
-    time.sleep(0.3)
+    settle("click_right_upper", 0.3)
     pyautogui.click(x, y)
+    invalidate_frame()
 
 def click_right_lower(region):
     x = region.left + region.width + 15
     y = region.top + region.height - region.height // 4
     pyautogui.click(x, y)
+    invalidate_frame()
 
 
 
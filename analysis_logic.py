@@ -6,14 +6,20 @@ Dette modul håndterer opdeling af lange optagelser i mindre samples
 """
 
 import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
 from datetime import timedelta
 from typing import List, Dict, Any, Tuple
 import logging
 
-from config import DAY_INTERVALS, MAX_SAMPLES_PER_FILE, MAX_READ_LENGTH, LOG_FILE, \
-    FIRST_SAMPLE_BUFFER_SECONDS
+import numpy as np
+
+from config import DAY_INTERVALS, MAX_SAMPLES_PER_FILE, MAX_READ_LENGTH, \
+    FIRST_SAMPLE_BUFFER_SECONDS, BLOCK_PARTITION
 
 DEFAULT_INTERVALS = DAY_INTERVALS
+DAY_SECONDS = 24 * 3600
 logger = logging.getLogger(__name__)
 
 
@@ -53,61 +59,444 @@ def td_to_str(td):
     return f"{hours:02}:{minutes:02}:{seconds:02}"
 
 
+def parse_seconds(time_str: str) -> int:
+    """
+    Konverterer en tid-streng ("HH:MM:SS", "HH.MM.SS" eller "HH:MM") til hele sekunder
+    """
+    h, m, s = parse_time_tuple(time_str)[:3]
+    return (h * 60 + m) * 60 + s
+
+
+def seconds_to_str(seconds: int) -> str:
+    """
+    Konverterer hele sekunder til "HH:MM:SS" (timer kan overstige 24)
+    """
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+def _boundary_seconds(value) -> int:
+    """
+    Konverterer en intervalgrænse til sekunder efter midnat
+    Grænser kan være hele timer (7) eller klokkeslæt som streng ("22:30")
+    """
+    if isinstance(value, str):
+        h, m, sec = parse_time_tuple(value)[:3]
+    else:
+        h, m, sec = int(value), 0, 0
+    if not (0 <= h <= 24 and 0 <= m < 60 and 0 <= sec < 60) or (h == 24 and (m or sec)):
+        raise ValueError(f"Ugyldig intervalgrænse: {value!r}")
+    return (h * 60 + m) * 60 + sec
+
+
+@dataclass(frozen=True, slots=True)
+class IntervalTable:
+    """
+    Intervallerne kompileret til en sorteret tabel over døgnet.
+    boundaries[i] er starten (sekunder efter midnat) på segment i; segmentet har
+    labels[i] og slutter med intervallet ends[i] (None = 24-timers interval,
+    GAP = ikke dækket af noget interval)
+    """
+    boundaries: Tuple[int, ...]
+    labels: Tuple[str, ...]
+    ends: Tuple[int | None, ...]
+    gaps: int
+
+    GAP = -1
+
+    def segment(self, second_of_day: int) -> int:
+        return bisect_right(self.boundaries, second_of_day) - 1
+
+    def label_at(self, seconds: int) -> str:
+        """Label for et tidspunkt (sekunder fra optagelsesdagens midnat)"""
+        return self.labels[self.segment(seconds % DAY_SECONDS)]
+
+    def next_end(self, current: int) -> int:
+        """Hvornår det interval der indeholder current slutter (absolutte sekunder)"""
+        seg = self.segment(current % DAY_SECONDS)
+        today = current - current % DAY_SECONDS
+        end = self.ends[seg]
+        if end is None:  # 24-timers interval
+            return current + DAY_SECONDS
+        if end == self.GAP:
+            # Udækket tid slutter ved næste grænse i tabellen
+            nxt = self.boundaries[seg + 1] if seg + 1 < len(self.boundaries) else DAY_SECONDS
+            return today + nxt
+        interval_end = today + end
+        if interval_end <= current:
+            interval_end += DAY_SECONDS
+        return interval_end
+
+
+def _interval_text(start_raw: int, end_raw: int) -> str:
+    return f"{seconds_to_str(start_raw)}-{seconds_to_str(end_raw)}"
+
+
+@lru_cache(maxsize=32)
+def _compile_intervals(intervals: Tuple[Tuple[Any, Any, Any], ...], use_custom_intervals: bool) -> IntervalTable:
+    parsed = []
+    for label, start, end in intervals:
+        start_raw, end_raw = _boundary_seconds(start), _boundary_seconds(end)
+        parsed.append((label, start_raw % DAY_SECONDS, end_raw % DAY_SECONDS, start_raw, end_raw))
+
+    cuts = sorted({0} | {p[1] for p in parsed} | {p[2] for p in parsed})
+    labels, ends = [], []
+    gaps = 0
+    for cut in cuts:
+        # Første interval der dækker segmentet vinder, ligesom den oprindelige lineære søgning
+        for label, start, end, start_raw, end_raw in parsed:
+            if start == end:  # 24-timers interval
+                labels.append("00:00:00-24:00:00" if use_custom_intervals else "24h")
+                ends.append(None)
+                break
+            if (start <= cut < end) if start < end else (cut >= start or cut < end):
+                labels.append(_interval_text(start_raw, end_raw) if use_custom_intervals else label)
+                ends.append(end)
+                break
+        else:
+            labels.append("ukendt")
+            ends.append(IntervalTable.GAP)
+            gaps += 1
+
+    if gaps:
+        logger.error(f"Intervallerne dækker ikke hele døgnet ({gaps} udækkede perioder): {list(intervals)}")
+    return IntervalTable(tuple(cuts), tuple(labels), tuple(ends), gaps)
+
+
+def compile_intervals(intervals=None, use_custom_intervals: bool = False) -> IntervalTable:
+    """
+    Kompilerer intervalkonfigurationen én gang til en opslagstabel (caches)
+    Rejser ValueError ved ugyldige grænser
+    """
+    if intervals is None:
+        intervals = DEFAULT_INTERVALS
+    key = tuple((label, start, end) for label, start, end in intervals)
+    return _compile_intervals(key, bool(use_custom_intervals))
+
+
 def interval_label(hour: int, intervals=None, use_custom_intervals=False) -> str:
     """
     Finder ud af hvilken periode på dagen en given time tilhører
     (fx "dag", "aften", "nat")
     """
-    if intervals is None:
-        intervals = DEFAULT_INTERVALS
-    for label, start, end in intervals:
-        if start < end:
-            if start <= hour < end:
-                if use_custom_intervals:
-                    return f"{start:02d}:00:00-{end:02d}:00:00"
-                return label
-        else:  # fx nat (23-7) eller 24-timers intervaller
-            if start == end:  # 24-timers interval
-                if use_custom_intervals:
-                    return "00:00:00-24:00:00"
-                return "24h"
-            elif hour >= start or hour < end:
-                if use_custom_intervals:
-                    return f"{start:02d}:00:00-{end:02d}:00:00"
-                return label
-    logger.error("Ukendt klokkeslæt i interval_label")
-    return "ukendt"
+    return compile_intervals(intervals, use_custom_intervals).label_at(hour * 3600)
 
 
 def next_interval_end(current_time: timedelta, intervals=None) -> timedelta:
     """
     Finder hvornår det nuværende tidsinterval slutter
     """
-    if intervals is None:
-        intervals = DEFAULT_INTERVALS
-    hour = int((current_time.total_seconds() // 3600) % 24)
-    today = timedelta(days=int(current_time.total_seconds() // (24 * 3600)))
-
-    for _, start, end in intervals:
-        if start < end:
-            if start <= hour < end:
-                interval_end = today + timedelta(hours=end)
-                if interval_end <= current_time:
-                    interval_end += timedelta(days=1)
-                return interval_end
-        else:  # fx nat eller 24-timers intervaller
-            if start == end:  # 24-timers interval
-                return current_time + timedelta(days=1)
-            elif hour >= start or hour < end:
-                interval_end = today
-                if hour >= start:
-                    interval_end += timedelta(days=1, hours=end)
-                else:
-                    interval_end += timedelta(hours=end)
-                if interval_end <= current_time:
-                    interval_end += timedelta(days=1)
-                return interval_end
-    return current_time + timedelta(hours=8)
+    end = compile_intervals(intervals).next_end(int(current_time.total_seconds()))
+    return timedelta(seconds=end)
+
+
+@dataclass(slots=True)
+class Sample:
+    """
+    Ét sample i en blok. Alle tider er hele sekunder:
+    start er absolut (fra midnat på optagelsens første dag),
+    block_start/block_end er relativt til optagelsens start (til Kubios' læse-dialog)
+    """
+    index: int
+    start: int
+    length: int
+    label: str
+    block_start: int = 0
+    block_end: int = 0
+
+    @property
+    def end(self) -> int:
+        return self.start + self.length
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Strenge-format som resten af programmet og Kubios bruger"""
+        return {
+            "index": self.index,
+            "start_time": seconds_to_str(self.start),
+            "length": seconds_to_str(self.length),
+            "label": self.label,
+            "block_start_time": seconds_to_str(self.block_start),
+            "block_end_time": seconds_to_str(self.block_end),
+        }
+
+
+@dataclass(slots=True)
+class Block:
+    """
+    En output-fil: de samples der analyseres efter én indlæsning i Kubios
+    """
+    output_filename: str
+    samples: List[Sample]
+    block_start: int
+    block_end: int
+
+    @property
+    def file_length(self) -> int:
+        return self.block_end - self.block_start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "output_filename": self.output_filename,
+            "samples": [smp.to_dict() for smp in self.samples],
+            "file_length": seconds_to_str(self.file_length),
+        }
+
+
+def _window_samples(start_offset: int, total_duration: int,
+                    sample_windows: List[Tuple[str, str]]) -> List[Sample]:
+    """
+    Laver samples ud fra faste tidsvinduer, gentaget for hver dag i optagelsen
+    """
+    samples = []
+    windows = [(w_start, w_end, parse_seconds(w_start), parse_seconds(w_end))
+               for w_start, w_end in sample_windows]
+    total_days = total_duration // DAY_SECONDS + 1
+    for day in range(total_days):
+        day_offset = day * DAY_SECONDS
+        for w_start, w_end, w_start_s, w_end_s in windows:
+            # Juster vinduet til at være inden for optagens grænser
+            sample_start = max(start_offset, day_offset + w_start_s)
+            sample_end = min(total_duration, day_offset + w_end_s)
+
+            # Spring over hvis vinduet er ugyldigt eller uden for grænser
+            if sample_start >= sample_end or sample_end <= start_offset:
+                continue
+            samples.append(Sample(len(samples) + 1, sample_start, sample_end - sample_start,
+                                  f"Dag {day + 1} {w_start}-{w_end}"))
+    return samples
+
+
+def _interval_samples(start_offset: int, total_duration: int, table: IntervalTable) -> List[Sample]:
+    """
+    Standard dag/aften/nat opdeling: ét sample pr. påbegyndt interval
+    """
+    samples = []
+    t = start_offset
+    while t < total_duration:
+        day_num = t // DAY_SECONDS + 1
+        label = table.label_at(t)
+        sample_end = min(table.next_end(t), total_duration)
+        samples.append(Sample(len(samples) + 1, t, sample_end - t, f"Dag {day_num} {label}"))
+        t = sample_end
+    return samples
+
+
+def _epoch_samples(start_offset: int, total_duration: int, epoch_seconds: int,
+                   table: IntervalTable) -> List[Sample]:
+    """
+    Faste epoker (fx 5 minutter) fra optagelsens start til slut.
+    Starttider, længder og labels beregnes som NumPy-arrays i ét gennemløb,
+    så en uges Holter med tusindvis af epoker ikke kræver et Python-loop pr. trin
+    """
+    if epoch_seconds <= 0:
+        raise ValueError(f"Epokelængde skal være positiv, fik {epoch_seconds} sekunder")
+    starts = np.arange(start_offset, total_duration, epoch_seconds, dtype=np.int64)
+    if starts.size == 0:
+        return []
+    lengths = np.minimum(epoch_seconds, total_duration - starts)
+
+    # Intervalnavne slås op for alle epoker på én gang i den kompilerede tabel
+    segments = np.searchsorted(table.boundaries, starts % DAY_SECONDS, side="right") - 1
+    interval_labels = np.array(table.labels)[segments]
+    clock = [np.char.zfill(part.astype(str), 2)
+             for part in ((starts // 3600) % 24, (starts // 60) % 60, starts % 60)]
+    labels = np.char.add("Dag ", (starts // DAY_SECONDS + 1).astype(str))
+    labels = np.char.add(np.char.add(labels, " "), interval_labels)
+    labels = np.char.add(np.char.add(labels, " "), clock[0])
+    labels = np.char.add(np.char.add(labels, ":"), clock[1])
+    labels = np.char.add(np.char.add(labels, ":"), clock[2])
+
+    return [Sample(idx, start, length, label)
+            for idx, (start, length, label) in enumerate(zip(starts.tolist(), lengths.tolist(),
+                                                             labels.tolist()), 1)]
+
+
+def _split_long_samples(samples: List[Sample], max_read_seconds: int) -> List[Sample]:
+    """
+    Opdeler samples der er længere end Kubios kan indlæse ad gangen
+    """
+    result = []
+    for smp in samples:
+        if smp.length <= max_read_seconds:
+            smp.index = len(result) + 1
+            result.append(smp)
+            continue
+        # Opdel dette sample i stykker på max_read_seconds eller mindre
+        seg_start = smp.start
+        seg_length = smp.length
+        while seg_length > 0:
+            cur_len = min(seg_length, max_read_seconds)
+            label = smp.label
+            if seg_length > max_read_seconds:
+                label += f" ({seconds_to_str(seg_start)} - {seconds_to_str(seg_start + cur_len)})"
+            result.append(Sample(len(result) + 1, seg_start, cur_len, label))
+            seg_start += cur_len
+            seg_length -= cur_len
+    return result
+
+
+def _group_samples(samples: List[Sample], max_read_seconds: int) -> List[List[Sample]]:
+    """
+    Grupperer samples grådigt i blokke hvis samlede tidsspænd er ≤ max_read_seconds
+    """
+    groups: List[List[Sample]] = []
+    cur_group: List[Sample] = []
+    for smp in samples:
+        # Start en ny blok hvis tidsperioden bliver for lang med dette sample
+        if cur_group and smp.end - cur_group[0].start > max_read_seconds:
+            groups.append(cur_group)
+            cur_group = []
+        cur_group.append(smp)
+    if cur_group:
+        groups.append(cur_group)
+    return groups
+
+
+def _greedy_file_count(groups: List[List[Sample]], max_samples_per_file: int) -> int:
+    """Antal filer (= indlæsninger i Kubios) den grådige opdeling giver"""
+    return sum(-(-len(group) // max_samples_per_file) for group in groups)
+
+
+def _partition_optimal(samples: List[Sample], max_read_seconds: int,
+                       max_samples_per_file: int) -> List[List[Sample]]:
+    """
+    Opdeler samples i færrest mulige blokke hvor hver blok både har tidsspænd
+    ≤ max_read_seconds og højst max_samples_per_file samples.
+    Dynamisk programmering over sample-grænser: best[i] er den bedste opdeling af
+    de første i samples. Blandt opdelinger med samme antal blokke vælges den mest
+    balancerede (mindste sum af kvadrerede blokstørrelser, derefter tidsspænd)
+    """
+    n = len(samples)
+    if n == 0:
+        return []
+    # best[i] = (antal blokke, sum af antal², sum af spænd², start på sidste blok)
+    best: List[Tuple[int, int, int, int] | None] = [None] * (n + 1)
+    best[0] = (0, 0, 0, 0)
+    for i in range(1, n + 1):
+        end = samples[i - 1].end
+        candidate = None
+        for j in range(i - 1, max(i - max_samples_per_file, 0) - 1, -1):
+            span = end - samples[j].start
+            if span > max_read_seconds:
+                break  # Tidlige starter giver kun længere spænd
+            prev = best[j]
+            if prev is None:
+                continue
+            count = i - j
+            cost = (prev[0] + 1, prev[1] + count * count, prev[2] + span * span, j)
+            if candidate is None or cost[:3] < candidate[:3]:
+                candidate = cost
+        best[i] = candidate
+
+    groups = []
+    i = n
+    while i > 0:
+        j = best[i][3]
+        groups.append(samples[j:i])
+        i = j
+    groups.reverse()
+    return groups
+
+
+def _finalize_group(group: List[Sample], start_offset: int, recording_end: int) -> None:
+    """
+    Sætter blok-timing (relativt til optagelsens start) og anvender buffere
+    på første og sidste sample i blokken
+    """
+    # Oprindelig blok-timing gemmes før bufferne, så Kubios læser hele området
+    block_start_rel = group[0].start - start_offset
+    block_end_rel = group[-1].end - start_offset
+
+    # Første sample: start x sekunder senere og reducér længden tilsvarende,
+    # hvor x er FIRST_SAMPLE_BUFFER_SECONDS (kun hvis længden ikke bliver negativ)
+    first = group[0]
+    if first.length - FIRST_SAMPLE_BUFFER_SECONDS > 0:
+        first.start += FIRST_SAMPLE_BUFFER_SECONDS
+        first.length -= FIRST_SAMPLE_BUFFER_SECONDS
+
+    # Sidste sample: start 2 sekunder tidligere (men behold oprindelige label og længde)
+    if len(group) > 1:
+        last = group[-1]
+        new_last_start = last.start - 2
+        # Sørg for at den sidste sample ikke overskrider optagelsens varighed
+        if new_last_start + last.length > recording_end:
+            adjusted_length = recording_end - new_last_start
+            if adjusted_length > 0:
+                last.start = new_last_start
+                last.length = adjusted_length
+                logger.info(f"Justerede sidste sample længde til at passe optagelse: {seconds_to_str(adjusted_length)}")
+            else:
+                logger.warning("Sidste samples justering ville skabe ugyldigt sample, beholder original")
+        else:
+            last.start = new_last_start
+
+    # Omnummerér og tilføj blok-timing til hvert sample
+    for idx, smp in enumerate(group, 1):
+        smp.index = idx
+        smp.block_start = block_start_rel
+        smp.block_end = block_end_rel
+
+
+def plan_samples(
+        start_time: str,
+        duration_str: str,
+        patient_id: str,
+        max_samples_per_file: int = MAX_SAMPLES_PER_FILE,
+        intervals: List[Tuple[str, int, int]] = None,
+        sample_windows: List[Tuple[str, str]] = None,
+        use_custom_intervals: bool = False,
+        epoch_seconds: int | None = None,
+        partition: str = BLOCK_PARTITION
+) -> List[Block]:
+    """
+    Opdeler en lang optagelse i blokke af samples (samme argumenter som split_samples)
+    Alle beregninger sker i hele sekunder; strenge laves først ved to_dict()
+    - partition: "greedy" (blokke på ≤MAX_READ_LENGTH timer, derefter opdelt efter
+      max_samples_per_file) eller "optimal" (færrest mulige indlæsninger i Kubios)
+    """
+    table = compile_intervals(intervals, use_custom_intervals)
+    start_offset = parse_seconds(start_time)
+    duration = parse_seconds(duration_str)
+    total_duration = start_offset + duration
+    max_read_seconds = MAX_READ_LENGTH * 3600
+
+    if epoch_seconds:
+        samples = _epoch_samples(start_offset, total_duration, epoch_seconds, table)
+    elif sample_windows:
+        samples = _window_samples(start_offset, total_duration, sample_windows)
+    else:
+        samples = _interval_samples(start_offset, total_duration, table)
+
+    samples = _split_long_samples(samples, max_read_seconds)
+    groups = _group_samples(samples, max_read_seconds)
+
+    output_files: List[Block] = []
+    if partition == "optimal":
+        # Hver blok er sin egen fil med sit eget læse-område
+        greedy_files = _greedy_file_count(groups, max_samples_per_file)
+        for group in _partition_optimal(samples, max_read_seconds, max_samples_per_file):
+            _finalize_group(group, start_offset, total_duration)
+            output_files.append(Block("TEMP", group, group[0].block_start, group[0].block_end))
+        logger.info(f"Optimal blokopdeling: {len(output_files)} filer i stedet for {greedy_files} "
+                    f"({greedy_files - len(output_files)} Kubios-genstarter sparet)")
+    elif partition == "greedy":
+        # Opdel blokke efter max_samples_per_file; hver fil læser hele blokkens tidsområde
+        for group in groups:
+            _finalize_group(group, start_offset, total_duration)
+            for i in range(0, len(group), max_samples_per_file):
+                output_files.append(Block("TEMP", group[i:i + max_samples_per_file],
+                                          group[0].block_start, group[0].block_end))
+    else:
+        raise ValueError(f"Ukendt blokopdeling: {partition!r}")
+
+    # Generer filnavne
+    total_files = len(output_files)
+    for i, blk in enumerate(output_files, 1):
+        blk.output_filename = f"{patient_id}_HRV_analysis_{i}_of_{total_files}"
+
+    logger.info("Genererede %d samples → %d filer (≤%dh pr blok)", len(samples), total_files, MAX_READ_LENGTH)
+    return output_files
 
 
 def split_samples(
@@ -117,7 +506,9 @@ def split_samples(
         max_samples_per_file: int = MAX_SAMPLES_PER_FILE,
         intervals: List[Tuple[str, int, int]] = None,
         sample_windows: List[Tuple[str, str]] = None,
-        use_custom_intervals: bool = False
+        use_custom_intervals: bool = False,
+        epoch_seconds: int | None = None,
+        partition: str = BLOCK_PARTITION
 ) -> List[Dict[str, Any]]:
     """
     Hovedfunktionen der opdeler en lang optagelse i mindre samples
@@ -128,220 +519,21 @@ def split_samples(
     - intervals: Tidsintervaller (dag/aften/nat)
     - sample_windows: Specifikke tidsvinduer at analysere
     - use_custom_intervals: Om der skal bruges specielle intervaller
+    - epoch_seconds: Faste epoker af denne længde i stedet for intervaller/vinduer
+    - partition: "greedy" eller "optimal" blokopdeling (se plan_samples)
 
-    Returnerer en liste med filer, der hver indeholder flere samples
+    Returnerer en liste med filer, der hver indeholder flere samples (som ordbøger)
     """
     logger.info(f"Opdeler samples for {patient_id}: start={start_time}, varighed={duration_str}")
-
-    # Konverter start-tid og varighed til tids-objekter
-    h, m, s = map(int, re.split(r'[:.]', start_time))
-    start_offset = timedelta(hours=h, minutes=m, seconds=s)
-    duration_td = parse_duration(duration_str)
-    total_duration = start_offset + duration_td
-    samples = []
-    idx = 1
-
-    # Hvis der er specifikke tidsvinduer angivet
-    if sample_windows:
-        total_days = int(((duration_td + start_offset).total_seconds() // (24 * 3600))) + 1
-        for day in range(total_days):
-            for w_start, w_end in sample_windows:
-                sh, sm, ss = parse_time_tuple(w_start)
-                eh, em, es = parse_time_tuple(w_end)
-
-                # Beregn absolutte vinduestider for denne dag
-                window_start = timedelta(days=day, hours=sh, minutes=sm, seconds=ss)
-                window_end = timedelta(days=day, hours=eh, minutes=em, seconds=es)
-
-                # Juster vinduet til at være inden for optagens grænser
-                sample_start = max(start_offset, window_start)
-                sample_end = min(total_duration, window_end)
-
-                # Spring over hvis vinduet er ugyldigt eller uden for grænser
-                if sample_start >= sample_end or sample_end <= start_offset:
-                    continue
-
-                # Gem sample med absolut tid
-                abs_start = sample_start
-                length = sample_end - sample_start
-                samples.append({
-                    "index": idx,
-                    "start_time": td_to_str(abs_start),
-                    "length": td_to_str(length),
-                    "label": f"Dag {day + 1} {w_start}-{w_end}"
-                })
-                idx += 1
-    # Standard dag/aften/nat opdeling
-    else:
-        t = start_offset
-        while t < total_duration:
-            day_num = int((t.total_seconds() // (24 * 3600)) + 1)
-            abs_hour = int((t.total_seconds() // 3600) % 24)
-            label = interval_label(abs_hour, intervals=intervals,
-                                   use_custom_intervals=use_custom_intervals)
-            sample_start = t
-            sample_end = next_interval_end(t, intervals=intervals)
-            if sample_end > total_duration:
-                sample_end = total_duration
-
-            # Gem sample med absolut tid
-            abs_start = sample_start
-            length = sample_end - sample_start
-            samples.append({
-                "index": idx,
-                "start_time": td_to_str(abs_start),
-                "length": td_to_str(length),
-                "label": f"Dag {day_num} {label}"
-            })
-            t = sample_end
-            idx += 1
-
-    # Opdel samples der er for lange
-    split_samples_list = []
-    new_idx = 1
-    for smp in samples:
-        smp_td = str_to_td(smp["length"])
-        if smp_td > timedelta(hours=MAX_READ_LENGTH):
-            # Opdel dette sample i stykker på MAX_READ_LENGTH eller mindre
-            seg_start = str_to_td(smp["start_time"])
-            seg_length = smp_td
-            while seg_length > timedelta():
-                cur_len = min(seg_length, timedelta(hours=MAX_READ_LENGTH))
-                split_samples_list.append({
-                    "index": new_idx,
-                    "start_time": td_to_str(seg_start),
-                    "length": td_to_str(cur_len),
-                    "label": smp["label"] + (
-                        f" ({td_to_str(seg_start)} - {td_to_str(seg_start + cur_len)})" if seg_length > timedelta(
-                            hours=MAX_READ_LENGTH) else "")
-                })
-                seg_start += cur_len
-                seg_length -= cur_len
-                new_idx += 1
-        else:
-            smp = smp.copy()
-            smp["index"] = new_idx
-            split_samples_list.append(smp)
-            new_idx += 1
-
-    # Gruppér opdelte samples i blokke på ≤80 timer
-    blocks: List[List[Dict[str, Any]]] = []
-    cur_block: List[Dict[str, Any]] = []
-
-    for smp in split_samples_list:
-        # Beregn hvor lang tidsperioden ville blive hvis vi tilføjer denne samples
-        if cur_block:
-            first_start = str_to_td(cur_block[0]["start_time"])
-            current_end = str_to_td(smp["start_time"]) + str_to_td(smp["length"])
-            total_span = current_end - first_start
-
-            if total_span > timedelta(hours=MAX_READ_LENGTH):
-                # Start en ny blok
-                blocks.append(cur_block)
-                cur_block = []
-
-        cur_block.append(smp)
-
-    if cur_block:
-        blocks.append(cur_block)
-
-    # Tilføj relative tidsstempler for blokke samt justeringer
-    for block_idx, block in enumerate(blocks):
-        if not block:
-            continue
-
-        # Beregn oprindelige blok start/slut tider relativt til optagelsens start
-        first_sample_abs = str_to_td(block[0]["start_time"])
-        last_sample = block[-1]
-        last_sample_abs = str_to_td(last_sample["start_time"]) + str_to_td(last_sample["length"])
-
-        # Gem oprindelig blok-timing info (relativt til optagelse) til Kubios
-        block_start_rel = first_sample_abs - start_offset
-        block_end_rel = last_sample_abs - start_offset
-
-        # Anvend 1-sekund forskydninger på første og sidste samples
-        if len(block) > 0:
-            # Første samples: start x sekunder senere, reducér længde med x sekunder, hvor x er FIRST_SAMPLE_BUFFER_SECONDS
-            first_sample = block[0]
-            first_start_abs = str_to_td(first_sample["start_time"])
-            first_length = str_to_td(first_sample["length"])
-
-            # Anvend kun forskydning hvis det første sample starter præcis ved blok-start
-            if first_start_abs == first_sample_abs:
-                new_first_start = first_start_abs + timedelta(seconds=FIRST_SAMPLE_BUFFER_SECONDS)
-                new_first_length = first_length - timedelta(seconds=FIRST_SAMPLE_BUFFER_SECONDS)
-
-                # Sørg for at længden ikke bliver negativ
-                if new_first_length > timedelta(0):
-                    first_sample["start_time"] = td_to_str(new_first_start)
-                    first_sample["length"] = td_to_str(new_first_length)
-
-            # Sidste sample: start 2 sekunder tidligere (men behold oprindelige label og længde)
-            if len(block) > 1 or block[0] != last_sample:
-                last_sample = block[-1]
-                last_start_abs = str_to_td(last_sample["start_time"])
-                last_length = str_to_td(last_sample["length"])
-                new_last_start = last_start_abs - timedelta(seconds=2)
-
-                # Sørg for at den sidste sample ikke overskrider optagelsens varighed
-                last_end_time = new_last_start + last_length
-                recording_end = start_offset + duration_td
-
-                if last_end_time > recording_end:
-                    # Justér længden til at passe inden for optagens grænser
-                    adjusted_length = recording_end - new_last_start
-                    if adjusted_length > timedelta(0):
-                        last_sample["start_time"] = td_to_str(new_last_start)
-                        last_sample["length"] = td_to_str(adjusted_length)
-                        logger.info(f"Justerede sidste sample længde til at passe optagelse: {td_to_str(adjusted_length)}")
-                    else:
-                        # Hvis selv det justerede sample ville være ugyldig, behold original
-                        logger.warning("Sidste samples justering ville skabe ugyldigt sample, beholder original")
-                else:
-                    last_sample["start_time"] = td_to_str(new_last_start)
-
-        # Tilføj blok-timing metadata til hver sample til brug i main.py
-        for sample in block:
-            sample["block_start_time"] = td_to_str(block_start_rel)  # Relativt til Kubios
-            sample["block_end_time"] = td_to_str(block_end_rel)  # Sluttid til Kubios
-
-    # Omnummerér sample i hver blok
-    for block in blocks:
-        for idx, sample in enumerate(block, 1):
-            sample["index"] = idx
-
-    # Opdel blokke efter max_samples_per_file, beregn fil_længde
-    output_files: List[Dict[str, Any]] = []
-    for block in blocks:
-        for i in range(0, len(block), max_samples_per_file):
-            slice_samples = block[i:i + max_samples_per_file]
-            # Beregn samlet fil-længde ved brug af den oprindelige blok-timing
-            if slice_samples:
-                # Brug de gemte blok-timing metadata som bevarer oprindelig blok-længde
-                block_start_rel = str_to_td(slice_samples[0]["block_start_time"])
-                block_end_rel = str_to_td(slice_samples[0]["block_end_time"])
-                file_length = block_end_rel - block_start_rel
-                file_length_str = td_to_str(file_length)
-            else:
-                file_length_str = "00:00:00"
-            output_files.append({
-                "output_filename": "TEMP",
-                "samples": slice_samples,
-                "file_length": file_length_str
-            })
-
-    # Generer filnavne
-    total_files = len(output_files)
-    for i, f in enumerate(output_files, 1):
-        f["output_filename"] = f"{patient_id}_HRV_analysis_{i}_of_{total_files}"
-
-    logger.info("Genererede %d samples → %d filer (≤%dh pr blok)", len(split_samples_list), total_files, MAX_READ_LENGTH)
-    return output_files
+    blocks = plan_samples(start_time, duration_str, patient_id, max_samples_per_file,
+                          intervals=intervals, sample_windows=sample_windows,
+                          use_custom_intervals=use_custom_intervals, epoch_seconds=epoch_seconds,
+                          partition=partition)
+    return [blk.to_dict() for blk in blocks]
 
     
 # Test område
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, filename=LOG_FILE)
     print("BRUGERDEFINEREDE VINDUER:")
     sample_windows = [("07:00:00", "15:00:00")]
     out = split_samples("08:53:47", "147:00:00", "ID3", sample_windows=sample_windows)
@@ -15,10 +15,38 @@ DEFAULTS = {
     "files_dir": str(Path(__file__).parent.parent)
 }
 
-STARTUP_DELAY = 10
+STARTUP_TIMEOUT = 60  # Maks. sekunder fra start til Kubios' hovedvindue svarer
+STARTUP_TIMINGS_FILE = "kubios_startup_timings.jsonl"
 LOG_FILE ='kubios_automation.log'
+EDF_INDEX_CACHE = "edf_index_cache.json"  # Gemmes ved siden af user_config.json
+EDF_METADATA_CACHE = "edf_metadata_cache.json"  # Starttid/varighed pr. EDF-fil (se metadata_store)
 PROCESS_NAME = "kubioshrv"
 TITLE_KEYWORD = "Kubios"
+STATE_POLL_INTERVAL = 0.25  # Sekunder mellem klassifikationer af skærmen (se screen_state)
+# "processing" regnes for færdig når analysevinduet har været uændret længere end de stille perioder
+# der måles i kalibrerings-ventetider (se wait_for_processing_done), dog mindst PROCESSING_STABLE_SECONDS
+PROCESSING_STABLE_SECONDS = 0.8
+PROCESSING_START_GRACE = 2.0      # Sekunder "processing"-vinduet (eller en ændring på skærmen) kan være om at vise sig
+PROCESSING_CALIBRATE_EVERY = 20   # Hver n'te ventetid venter som før og måler de stille perioder
+# Glyf-skabeloner til tid/længde-felterne (se digit_ocr) og mappen hvor nye udsnit samles
+DIGIT_GLYPHS_FILE = "assets/digit_glyphs.npz"
+DIGIT_SAMPLES_DIR = "assets/digit_samples"
+TESSERACT_DIGITS_CONFIG = "--psm 7 -c tessedit_char_whitelist=0123456789:."
+TEXT_ENTRY_VERIFY = True  # Læs felter tilbage efter indsætning via udklipsholderen (se text_entry)
+FILE_DIALOG_TITLE = "open"  # Titel på Kubios' fil-dialoger (fx "Open" / "Åbn")
+# Lærte timeouts (se timing_model): p99 af de seneste TIMING_WINDOW målinger * faktor + margin
+TIMING_MODEL_FILE = "kubios_timing_model.json"
+TIMING_WINDOW = 200
+TIMING_MIN_SAMPLES = 10
+TIMEOUT_MARGIN_FACTOR = 1.5
+TIMEOUT_MARGIN_SECONDS = 2.0
+TIMEOUT_MAX_FACTOR = 4  # En lært timeout bliver aldrig længere end standardværdien gange dette
+CAPTURE_TTL = 0.05  # Sekunder et skærmbillede genbruges af andre detektorer (se screen_capture)
+TRACE_FILE = "kubios_trace.jsonl"  # Spans pr. trin som JSON-linjer (se tracing)
+
+# Kubios genstartes kun mellem blokke hvis en af disse grænser overskrides (eller der var fejl)
+KUBIOS_MAX_RSS_MB = 3000
+KUBIOS_MAX_HANDLES = 10000
 
 DAY_INTERVALS = [
     ("dag", 7, 15),
@@ -30,7 +58,36 @@ MAX_READ_LENGTH_SPLIT = 60
 MAX_SAMPLES_PER_FILE = 15
 BUFFER_HOURS = 0
 FIRST_SAMPLE_BUFFER_SECONDS = 5
+# Indtast alle samples i en blok uden genberegnings-ventetid imellem og vent én gang til sidst
+BATCHED_SAMPLE_ENTRY = False
+# Blokopdeling: "greedy" er den oprindelige opdeling, "optimal" minimerer antal Kubios-genstarter.
+# Vælg "optimal" med "block_partition" i user_config.json. Opdelingen bestemmer blokkenes grænser og
+# filnavne, så et skift mellem de to midt i en kohorte gør at journalens gemte blokke ikke genkendes
+# og analyseres igen
+BLOCK_PARTITION = "greedy"
+
+# Anslået tid i sekunder for hvert trin i Kubios-automatiseringen (bruges af planner.py)
+STEP_COST_SECONDS = {
+    "open_kubios": 20,      # Opstart af Kubios inkl. ventetider
+    "open_edf": 15,         # Ctrl+O, indtastning af sti og indlæsning
+    "read_block": 15,       # Læs data-dialog og vent på analysevindue
+    "add_sample": 25,       # Indtastning af sample inkl. to "processing"-ventetider
+    "save_results": 20,     # Gem-dialog og skrivning af Excel-fil
+    "close_kubios": 8,      # Lukning af Kubios mellem blokke og filer
+}
+# Span (se tracing) hvis varighed gemmes i timing-modellen for hvert trin i STEP_COST_SECONDS;
+# planner.py bruger medianen i stedet for den faste værdi når der er målinger nok
+STEP_COST_SPANS = {
+    "open_kubios": "open_kubios",
+    "open_edf": "open_edf_file",
+    "read_block": "perform_read",
+    "add_sample": "add_sample",
+    "save_results": "save_results",
+    "close_kubios": "close_kubios",
+}
 
+# Programmets eneste logging-opsætning: alle moduler importerer config, så den gælder uanset
+# hvilket modul der startes. Spans fra tracing går til deres egen fil (TRACE_FILE)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -0,0 +1,198 @@
+"""digit_ocr.py
+Læser "HH:MM:SS" fra Kubios' tid- og længde-felter uden Tesseract.
+
+Kubios bruger en fast skrifttype, så hvert tegn (0-9, ":" og ".") ser ens ud hver
+gang. Udsnittet binariseres, deles i tegn ved tomme kolonner, og hvert tegn
+sammenlignes med gemte glyf-skabeloner ved normaliseret korrelation (ét
+matrix-produkt). Skabelonerne bygges fra nogle få gemte udsnit med kendt tekst.
+
+Hver aflæsning har en sikkerhed (laveste korrelation) og en margin (afstand til
+næstbedste tegn); kun tvetydige aflæsninger skal sendes videre til Tesseract.
+Et sæt skabeloner bruges kun hvis alle REQUIRED_CHARS er med, da et tegn uden
+skabelon ellers ville blive læst sikkert som det nærmeste tegn der har en.
+
+Byg skabeloner fra udsnit, hvor filnavnet er teksten med "-" i stedet for ":":
+    python digit_ocr.py build assets/digit_samples
+Læs et udsnit:
+    python digit_ocr.py read udsnit.png
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import cv2
+import numpy as np
+
+from config import DIGIT_GLYPHS_FILE
+
+logger = logging.getLogger(__name__)
+
+GLYPH_CHARS = "0123456789:."
+# "." er valgfri: uden egen skabelon læses den som ":", og tiderne normaliseres alligevel til ":"
+REQUIRED_CHARS = "0123456789:"
+GLYPH_SIZE = (8, 12)  # (bredde, højde) som alle tegn skaleres til før sammenligning
+MIN_CONFIDENCE = 0.85
+MIN_MARGIN = 0.10
+
+
+@dataclass(frozen=True)
+class DigitRead:
+    text: str
+    confidence: float  # Laveste korrelation blandt tegnene (0 hvis intet kunne læses)
+    margin: float      # Mindste afstand mellem bedste og næstbedste tegn
+
+    @property
+    def certain(self) -> bool:
+        return bool(self.text) and self.confidence >= MIN_CONFIDENCE and self.margin >= MIN_MARGIN
+
+
+def _binarize(gray: np.ndarray) -> np.ndarray:
+    """Tekst = True. Otsu-tærskel, og inverteres så baggrunden (flertallet af pixels) er False"""
+    _, binary = cv2.threshold(np.ascontiguousarray(gray, dtype=np.uint8), 0, 1,
+                              cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    binary = binary.astype(bool)
+    return ~binary if binary.mean() > 0.5 else binary
+
+
+def segment(gray: np.ndarray) -> List[Tuple[np.ndarray, int]]:
+    """
+    Deler udsnittet i tegn adskilt af tomme kolonner
+    Returnerer (normaliseret glyf-vektor, bredde i pixels) pr. tegn
+    """
+    ink = _binarize(gray)
+    rows = np.flatnonzero(ink.any(axis=1))
+    if rows.size == 0:
+        return []
+    # Fælles top/bund for hele linjen, så ":" og "." beholder deres lodrette placering
+    line = ink[rows[0]:rows[-1] + 1]
+    columns = line.any(axis=0)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], columns.view(np.int8), [0]))))
+    glyphs = []
+    for start, stop in zip(edges[::2], edges[1::2]):
+        crop = line[:, start:stop]
+        if crop.sum() < 2:  # Enkeltstående støjpixels
+            continue
+        vec = cv2.resize(crop.astype(np.float32), GLYPH_SIZE, interpolation=cv2.INTER_AREA).ravel()
+        vec -= vec.mean()
+        norm = np.linalg.norm(vec)
+        glyphs.append((vec / norm if norm else vec, int(stop - start)))
+    return glyphs
+
+
+class GlyphSet:
+    """Én gennemsnitlig skabelon pr. tegn"""
+
+    def __init__(self, chars: str, vectors: np.ndarray, widths: np.ndarray):
+        self.chars = chars
+        self.vectors = vectors  # (antal tegn, GLYPH_SIZE[0] * GLYPH_SIZE[1])
+        self.widths = widths
+
+    @property
+    def missing(self) -> str:
+        return "".join(c for c in REQUIRED_CHARS if c not in self.chars)
+
+    @classmethod
+    def build(cls, samples: Iterable[Tuple[np.ndarray, str]]) -> "GlyphSet":
+        """Bygger skabeloner fra (gråtone-udsnit, kendt tekst); udsnit der ikke kan segmenteres springes over"""
+        collected: Dict[str, List[Tuple[np.ndarray, int]]] = {}
+        for gray, text in samples:
+            glyphs = segment(gray)
+            if len(glyphs) != len(text):
+                logger.warning(f"Glyph sample '{text}': fandt {len(glyphs)} tegn, springes over")
+                continue
+            for char, glyph in zip(text, glyphs):
+                collected.setdefault(char, []).append(glyph)
+        chars = "".join(c for c in GLYPH_CHARS if c in collected)
+        missing = "".join(c for c in REQUIRED_CHARS if c not in collected)
+        if missing:
+            raise ValueError(f"Glyph samples mangler tegnene '{missing}'")
+        vectors = []
+        for char in chars:
+            mean = np.mean([vec for vec, _ in collected[char]], axis=0)
+            vectors.append(mean / (np.linalg.norm(mean) or 1.0))
+        widths = np.array([np.mean([w for _, w in collected[c]]) for c in chars], dtype=np.float32)
+        return cls(chars, np.asarray(vectors, dtype=np.float32), widths)
+
+    def save(self, path=DIGIT_GLYPHS_FILE) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, chars=np.array(self.chars), vectors=self.vectors, widths=self.widths)
+
+    @classmethod
+    def load(cls, path=DIGIT_GLYPHS_FILE) -> "GlyphSet":
+        with np.load(path) as data:
+            return cls(str(data["chars"]), data["vectors"], data["widths"])
+
+    def read(self, gray: np.ndarray) -> DigitRead:
+        glyphs = segment(gray)
+        if not glyphs:
+            return DigitRead("", 0.0, 0.0)
+        vecs = np.stack([vec for vec, _ in glyphs])
+        widths = np.array([w for _, w in glyphs], dtype=np.float32)[:, None]
+        # Korrelation vægtet med hvor godt bredden passer (fx "1" mod "0")
+        scores = (vecs @ self.vectors.T) * (np.minimum(widths, self.widths) / np.maximum(widths, self.widths))
+        order = np.argsort(-scores, axis=1)
+        rows = np.arange(len(glyphs))
+        best = scores[rows, order[:, 0]]
+        second = scores[rows, order[:, 1]] if scores.shape[1] > 1 else np.zeros_like(best)
+        text = "".join(self.chars[i] for i in order[:, 0])
+        return DigitRead(text, float(best.min()), float((best - second).min()))
+
+
+_glyphs: GlyphSet | None = None
+_glyphs_loaded = False
+
+
+def get_glyphs() -> GlyphSet | None:
+    """Skabelonerne fra DIGIT_GLYPHS_FILE, eller None hvis de ikke er bygget endnu"""
+    global _glyphs, _glyphs_loaded
+    if not _glyphs_loaded:
+        _glyphs_loaded = True
+        try:
+            glyph_set = GlyphSet.load()
+        except (OSError, KeyError, ValueError) as e:
+            logger.info(f"Ingen glyph-skabeloner ({DIGIT_GLYPHS_FILE}), bruger Tesseract: {e}")
+            return None
+        if glyph_set.missing:
+            logger.warning(f"Glyph-skabelonerne i {DIGIT_GLYPHS_FILE} mangler '{glyph_set.missing}', bruger Tesseract")
+            return None
+        _glyphs = glyph_set
+    return _glyphs
+
+
+def read_digits(gray: np.ndarray) -> DigitRead:
+    glyphs = get_glyphs()
+    return glyphs.read(gray) if glyphs else DigitRead("", 0.0, 0.0)
+
+
+def _load_samples(directory) -> List[Tuple[np.ndarray, str]]:
+    samples = []
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix.lower() in (".png", ".bmp"):
+            # Filnavne kan ikke indeholde ":", så "-" bruges i stedet; "_2" osv. til dubletter ignoreres
+            text = path.stem.split("_")[0].replace("-", ":")
+            img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+            if img is not None:
+                samples.append((img, text))
+    return samples
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 3 and sys.argv[1] == "build":
+        glyph_set = GlyphSet.build(_load_samples(sys.argv[2]))
+        glyph_set.save()
+        print(f"Gemt {len(glyph_set.chars)} tegn ({glyph_set.chars}) i {DIGIT_GLYPHS_FILE}")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "read":
+        image = cv2.imread(sys.argv[2], cv2.IMREAD_GRAYSCALE)
+        t0 = time.perf_counter()
+        result = read_digits(image)
+        print(f"{result.text!r} sikkerhed {result.confidence:.2f} margin {result.margin:.2f} "
+              f"({(time.perf_counter() - t0) * 1000:.2f} ms)")
+    else:
+        print(__doc__)
@@ -0,0 +1,184 @@
+"""edf_header.py
+Læser starttid, varighed og kanalinformation direkte fra EDF/EDF+/BDF-headeren,
+så optagelsens længde kan kendes uden at åbne filen i Kubios og bruge OCR.
+
+Header-layout (de første 256 bytes, alle felter er ASCII):
+    0    8  version ("0" for EDF, 0xFF + "BIOSEMI" for BDF)
+    8   80  patient-id
+    88  80  optagelses-id
+    168  8  startdato dd.mm.yy
+    176  8  starttid hh.mm.ss
+    184  8  antal bytes i header
+    192 44  reserveret ("EDF+C" / "EDF+D" for EDF+)
+    236  8  antal data-records (-1 hvis ukendt)
+    244  8  varighed af én data-record i sekunder
+    252  4  antal signaler (ns)
+Derefter følger ns * 256 bytes med signal-headere.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from datetime import date
+from fractions import Fraction
+from pathlib import Path
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+HEADER_SIZE = 256
+SIGNAL_HEADER_SIZE = 256
+US_PER_SECOND = 1_000_000
+
+
+class UnsupportedEdfError(ValueError):
+    """Filen kan ikke læses af header-parseren (fx EDF+D) – brug OCR i stedet"""
+
+
+@dataclass(frozen=True)
+class EdfMetadata:
+    """Metadata fra EDF-headeren. Alle tider er i mikrosekunder"""
+    path: Path
+    file_format: str            # "EDF", "EDF+C" eller "BDF"
+    start_date: date | None
+    start_us: int               # Tidspunkt på døgnet hvor optagelsen starter
+    duration_us: int            # Samlet optagelseslængde
+    record_count: int
+    record_duration_us: int
+    channels: Tuple[str, ...] = field(default_factory=tuple)
+    samples_per_record: Tuple[int, ...] = field(default_factory=tuple)
+
+    @property
+    def start_str(self) -> str:
+        """Starttid som "HH:MM:SS" til split_samples"""
+        return us_to_str(self.start_us)
+
+    @property
+    def duration_str(self) -> str:
+        """Varighed som "HH:MM:SS" til split_samples (samme format som Kubios viser)"""
+        return us_to_str(self.duration_us)
+
+
+def us_to_str(us: int) -> str:
+    """
+    Konverterer mikrosekunder til "HH:MM:SS" (timer kan overstige 24)
+    Brøkdele af sekunder skæres af, ligesom td_to_str gør
+    """
+    total_seconds = us // US_PER_SECOND
+    hours, remainder = divmod(total_seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+def _ascii(raw: bytes) -> str:
+    return raw.decode("ascii", errors="replace").strip()
+
+
+def _parse_start(date_field: str, time_field: str) -> Tuple[date | None, int]:
+    """Fortolker startdato "dd.mm.yy" og starttid "hh.mm.ss" fra headeren"""
+    try:
+        hh, mm, ss = (int(p) for p in time_field.split("."))
+    except ValueError:
+        raise UnsupportedEdfError(f"Ugyldig starttid i EDF-header: '{time_field}'")
+    if not (0 <= hh < 24 and 0 <= mm < 60 and 0 <= ss < 60):
+        raise UnsupportedEdfError(f"Ugyldig starttid i EDF-header: '{time_field}'")
+
+    start_date = None
+    try:
+        dd, mo, yy = (int(p) for p in date_field.split("."))
+        # EDF-specifikationen: 85-99 er 1985-1999, 00-84 er 2000-2084
+        start_date = date(1900 + yy if yy >= 85 else 2000 + yy, mo, dd)
+    except ValueError:
+        logger.warning(f"Kunne ikke læse startdato i EDF-header: '{date_field}'")
+
+    return start_date, ((hh * 60 + mm) * 60 + ss) * US_PER_SECOND
+
+
+def read_edf_metadata(edf_path) -> EdfMetadata:
+    """
+    Læser EDF-headeren og returnerer starttid og varighed i mikrosekunder
+
+    Rejser UnsupportedEdfError hvis formatet ikke kan håndteres (fx diskontinuerte
+    EDF+D-optagelser), så kalderen kan falde tilbage til OCR i Kubios
+    """
+    edf_path = Path(edf_path)
+    with open(edf_path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise UnsupportedEdfError(f"{edf_path.name}: header er kortere end {HEADER_SIZE} bytes")
+
+        if header[0:1] == b"\xff" and header[1:8] == b"BIOSEMI":
+            file_format, bytes_per_sample = "BDF", 3
+        elif _ascii(header[0:8]) == "0":
+            file_format, bytes_per_sample = "EDF", 2
+        else:
+            raise UnsupportedEdfError(f"{edf_path.name}: ukendt version '{header[0:8]!r}'")
+
+        reserved = _ascii(header[192:236])
+        if reserved.startswith("EDF+D"):
+            raise UnsupportedEdfError(f"{edf_path.name}: diskontinuert EDF+D understøttes ikke")
+        if reserved.startswith("EDF+C"):
+            file_format = "EDF+C"
+
+        start_date, start_us = _parse_start(_ascii(header[168:176]), _ascii(header[176:184]))
+
+        try:
+            header_bytes = int(_ascii(header[184:192]))
+            record_count = int(_ascii(header[236:244]))
+            # Fraction giver præcise mikrosekunder for fx "0.1" sekunders records
+            record_duration = Fraction(_ascii(header[244:252]))
+            signal_count = int(_ascii(header[252:256]))
+        except ValueError as e:
+            raise UnsupportedEdfError(f"{edf_path.name}: ugyldigt numerisk felt i header: {e}")
+
+        if signal_count <= 0 or record_duration <= 0:
+            raise UnsupportedEdfError(f"{edf_path.name}: ingen signaler eller record-varighed 0")
+
+        signal_header = f.read(signal_count * SIGNAL_HEADER_SIZE)
+        if len(signal_header) < signal_count * SIGNAL_HEADER_SIZE:
+            raise UnsupportedEdfError(f"{edf_path.name}: signal-header er afkortet")
+
+    # Signal-headeren er gemt felt for felt: ns labels, ns transducere osv.
+    channels = tuple(_ascii(signal_header[i * 16:(i + 1) * 16]) for i in range(signal_count))
+    spr_offset = signal_count * (16 + 80 + 8 * 5 + 80)
+    try:
+        samples_per_record = tuple(
+            int(_ascii(signal_header[spr_offset + i * 8:spr_offset + (i + 1) * 8]))
+            for i in range(signal_count)
+        )
+    except ValueError as e:
+        raise UnsupportedEdfError(f"{edf_path.name}: ugyldigt antal samples pr. record: {e}")
+
+    if record_count < 0:
+        # Antal records er ukendt (-1) når optagelsen ikke blev lukket korrekt,
+        # så det beregnes ud fra filstørrelsen
+        record_size = sum(samples_per_record) * bytes_per_sample
+        if record_size <= 0:
+            raise UnsupportedEdfError(f"{edf_path.name}: kan ikke beregne antal records")
+        record_count = (edf_path.stat().st_size - header_bytes) // record_size
+        logger.info(f"{edf_path.name}: antal records ukendt i header, beregnet til {record_count}")
+
+    record_duration_us = record_duration * US_PER_SECOND
+    metadata = EdfMetadata(
+        path=edf_path,
+        file_format=file_format,
+        start_date=start_date,
+        start_us=start_us,
+        duration_us=int(record_count * record_duration_us),
+        record_count=record_count,
+        record_duration_us=int(record_duration_us),
+        channels=channels,
+        samples_per_record=samples_per_record,
+    )
+    logger.info(f"EDF-header {edf_path.name}: format={file_format}, start={metadata.start_str}, "
+                f"varighed={metadata.duration_str}")
+    return metadata
+
+
+# Test område
+if __name__ == "__main__":
+    import sys
+    for arg in sys.argv[1:]:
+        md = read_edf_metadata(arg)
+        print(md.path.name, md.file_format, md.start_date, md.start_str, md.duration_str, md.channels)
@@ -4,19 +4,20 @@ benyttes til at håndtere EDF-listen + paths
 """
 
 
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, List, Tuple
 import pandas as pd
 import logging
-from config import LOG_FILE, EXCEL_PATH
+from config import EXCEL_PATH, EDF_INDEX_CACHE
+
+INDEX_CACHE_VERSION = 1
 
 excel_test_filepath = EXCEL_PATH
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename=LOG_FILE,
-    filemode='a'
-)
 def read_edf_list(excel_path, sheet_name=0):
     excel_path = Path(excel_path)
 
@@ -48,20 +49,190 @@ def read_edf_list(excel_path, sheet_name=0):
     logging.error(f"No columns found in '{excel_path}' in sheet {sheet_name}")
     raise ValueError(f"No columns found in '{excel_path}' in sheet {sheet_name}")
 
-def resolve_edf_paths(base_dir, edf_filenames):
+def _list_dir(path: str, suffix: str, cache: Dict[str, dict]) -> Tuple[dict | None, bool]:
+    """
+    Returnerer mappens indhold som {"mtime_ns", "subdirs", "files"} og om den blev læst fra disk
+    Hvis mappens mtime er uændret siden sidste kørsel genbruges indholdet fra cachen,
+    da mtime ændres når filer eller undermapper oprettes, slettes eller omdøbes i mappen
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None, False
+
+    cached = cache.get(path)
+    if cached is not None and cached.get("mtime_ns") == mtime_ns:
+        return cached, False
+
+    subdirs = []
+    files = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.name.lower().endswith(suffix):
+                        files.append(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        return None, False
+    return {"mtime_ns": mtime_ns, "subdirs": sorted(subdirs), "files": sorted(files)}, True
+
+
+def _scan_tree(root: str, suffix: str, cache: Dict[str, dict]) -> Tuple[Dict[str, dict], List[str], int]:
+    """
+    Gennemløber et undertræ med os.scandir (uden at følge symlinks)
+    Returnerer (mappe -> indhold, mapper der ikke kunne læses, antal mapper læst fra disk)
+    """
+    listing = {}
+    unreadable = []
+    rescanned = 0
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        entry, from_disk = _list_dir(current, suffix, cache)
+        if entry is None:
+            unreadable.append(current)
+            continue
+        listing[current] = entry
+        rescanned += from_disk
+        stack.extend(os.path.join(current, d) for d in entry["subdirs"])
+    return listing, unreadable, rescanned
+
+
+def load_index_cache(cache_path, suffix: str) -> Dict[str, dict]:
+    """Indlæser mappe-cachen fra tidligere kørsler (tom ved fejl eller anden filendelse)"""
+    cache_path = Path(cache_path)
+    if not cache_path.exists():
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        logging.warning(f"Could not read EDF index cache '{cache_path}': {e}")
+        return {}
+    if data.get("version") != INDEX_CACHE_VERSION or data.get("suffix") != suffix:
+        return {}
+    return data.get("dirs", {})
+
+
+def save_index_cache(cache_path, suffix: str, dirs: Dict[str, dict]) -> None:
+    """Gemmer mappe-cachen atomisk, så en afbrudt kørsel ikke efterlader en halv fil"""
+    cache_path = Path(cache_path)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_CACHE_VERSION, "suffix": suffix, "dirs": dirs}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not save EDF index cache '{cache_path}': {e}")
+
+
+@dataclass
+class EdfIndex:
+    """Indeks over filnavn -> stier bygget med én gennemgang af mappetræet"""
+    base_dir: Path
+    paths: Dict[str, List[Path]] = field(default_factory=dict)
+    unreadable_dirs: List[str] = field(default_factory=list)
+
+    def add(self, name: str, path: str) -> None:
+        # normcase gør opslag case-insensitive på Windows, ligesom rglob
+        self.paths.setdefault(os.path.normcase(name), []).append(Path(path))
+
+    def lookup(self, name: str) -> List[Path]:
+        return self.paths.get(os.path.normcase(name), [])
+
+    def resolve(self, edf_filenames) -> Tuple[List[Path], Dict[str, List[Path]], List[str]]:
+        """
+        Slår hele listen op i indekset
+        Returnerer (fundne stier, dubletter, manglende navne)
+        """
+        resolved = []
+        duplicates = {}
+        missing = []
+        for name in edf_filenames:
+            matches = self.lookup(name)
+            if not matches:
+                missing.append(name)
+                continue
+            if len(matches) > 1:
+                duplicates[name] = matches
+            resolved.append(matches[0])
+        return resolved, duplicates, missing
+
+
+def build_edf_index(base_dir, suffix: str = ".edf", workers: int = 8, cache_path=None) -> EdfIndex:
+    """
+    Bygger et filnavn -> sti indeks for alle filer med endelsen under base_dir
+    Undermapperne på øverste niveau gennemløbes parallelt, hvilket især hjælper på netværksdrev
+    Med cache_path genbruges mapper hvis mtime er uændret, så kun ændrede undertræer læses igen
+    """
+    base_dir = Path(base_dir)
+    index = EdfIndex(base_dir)
+    suffix = suffix.lower()
+    cache = load_index_cache(cache_path, suffix) if cache_path else {}
+
+    root = os.path.abspath(base_dir)
+    root_entry, from_disk = _list_dir(root, suffix, cache)
+    if root_entry is None:
+        logging.error(f"Could not read directory '{base_dir}'")
+        index.unreadable_dirs.append(root)
+        return index
+
+    listing = {root: root_entry}
+    rescanned = int(from_disk)
+    top_dirs = [os.path.join(root, d) for d in root_entry["subdirs"]]
+    if workers > 1 and len(top_dirs) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda d: _scan_tree(d, suffix, cache), top_dirs))
+    else:
+        results = [_scan_tree(d, suffix, cache) for d in top_dirs]
+
+    for sub_listing, unreadable, sub_rescanned in results:
+        listing.update(sub_listing)
+        index.unreadable_dirs.extend(unreadable)
+        rescanned += sub_rescanned
+
+    # Stierne indsættes sorteret, så første match er deterministisk
+    for directory in sorted(listing):
+        for name in listing[directory]["files"]:
+            index.add(name, os.path.join(directory, name))
+
+    if index.unreadable_dirs:
+        logging.warning(f"Could not read {len(index.unreadable_dirs)} directories under '{base_dir}'")
+    logging.info(f"Indexed {len(listing)} directories under '{base_dir}', {rescanned} read from disk")
+
+    if cache_path:
+        # Mapper der ikke længere findes under base_dir fjernes fra cachen, andre træer bevares
+        prefix = os.path.join(root, "")
+        kept = {d: e for d, e in cache.items() if d != root and not d.startswith(prefix)}
+        kept.update(listing)
+        save_index_cache(cache_path, suffix, kept)
+    return index
+
+
+def resolve_edf_paths_detailed(base_dir, edf_filenames) -> Tuple[List[Path], Dict[str, List[Path]], List[str]]:
+    """
+    Som resolve_edf_paths, men returnerer også dubletter og manglende navne
+    """
     base_dir = Path(base_dir).parent
-    resolved_edf_paths = []
-    error_paths = []
-    for name in edf_filenames:
-        matches = list(base_dir.rglob(name))
-        if matches:
-            resolved_edf_paths.append(matches[0])
-        else:
-            error_paths.append(name)
-            logging.warning(f"No EDF-file found with name: '{name}' in '{base_dir}'. Make sure excel file is in the same directory EDF-files")
+    index = build_edf_index(base_dir, cache_path=EDF_INDEX_CACHE)
+    resolved_edf_paths, duplicates, error_paths = index.resolve(edf_filenames)
+
+    for name, matches in duplicates.items():
+        logging.warning(f"EDF-file '{name}' found {len(matches)} times in '{base_dir}'. Using '{matches[0]}'. "
+                        f"Other matches: {[str(m) for m in matches[1:]]}")
+    for name in error_paths:
+        logging.warning(f"No EDF-file found with name: '{name}' in '{base_dir}'. Make sure excel file is in the same directory EDF-files")
 
     logging.info(f"Found {len(resolved_edf_paths)} existing EDF-files out of {len(edf_filenames)}. {error_paths} could not be resolved.")
-    return resolved_edf_paths
+    return resolved_edf_paths, duplicates, error_paths
+
+
+def resolve_edf_paths(base_dir, edf_filenames):
+    return resolve_edf_paths_detailed(base_dir, edf_filenames)[0]
 
 if __name__ == "__main__":
     print(read_edf_list(excel_test_filepath))
@@ -16,12 +16,9 @@ from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
-from config import DEFAULTS, LOG_FILE, DAY_INTERVALS
+from config import DEFAULTS, DAY_INTERVALS
+from analysis_logic import compile_intervals
 
-# Opsæt logning
-logging.basicConfig(filename=LOG_FILE,
-                    level=logging.INFO,
-                    format="%(asctime)s %(levelname)s %(name)s %(message)s")
 logger = logging.getLogger(__name__)
 
 USER_CONF = Path("user_config.json")
@@ -45,6 +42,16 @@ def save_cfg(cfg: dict) -> None:
         logger.error("GUI: kunne ikke gemme user_config.json: %s", exc)
         raise
 
+def _parse_boundary(text: str):
+    """Fortolk en intervalgrænse: "07" giver 7, "22:30" giver "22:30" (valideres af compile_intervals)"""
+    text = text.strip()
+    if ':' in text:
+        h, m = text.split(':')
+        if int(m) == 0:
+            return int(h)
+        return f"{int(h):02d}:{int(m):02d}"
+    return int(text)
+
 # Proxy-funktion til at køre hovedpipelinen
 
 def _run_pipeline(cfg: dict):
@@ -144,12 +151,12 @@ class ConfigUI(tk.Tk):
         ToolTip(output_btn, "Vælg mappe hvor analyserede filer skal gemmes")
 
         # Række 4 - Tidsintervaller tekstfelt
-        tk.Label(self, text="Intervaller (TT-TT, komma):").grid(row=4, column=0, sticky="e", pady=4)
+        tk.Label(self, text="Intervaller (TT[:MM]-TT[:MM], komma):").grid(row=4, column=0, sticky="e", pady=4)
         default_int = ",".join(f"{s}-{e}" for _, s, e in cfg.get("day_intervals", []))
         self.int_var = tk.StringVar(value=default_int)
         intervals_entry = tk.Entry(self, textvariable=self.int_var, width=55)
         intervals_entry.grid(row=4, column=1, columnspan=2, sticky="we")
-        ToolTip(intervals_entry, "Angiv tidsintervaller (f.eks. 07-15,15-23,23-07 for dag/aften/nat)")
+        ToolTip(intervals_entry, "Angiv tidsintervaller (f.eks. 07-15,15-23,23-07 for dag/aften/nat, eller 15-22:30)")
 
         # Række 5 - Kør knap
         run_btn = tk.Button(self, text="Gem & Kør", command=self.on_run, width=20)
@@ -196,22 +203,26 @@ class ConfigUI(tk.Tk):
         intervals_raw = self.int_var.get().strip()
         intervals_list = []
 
-        # Parse tidsintervaller hvis brugeren har angivet nogle
+        # Parse tidsintervaller hvis brugeren har angivet nogle (hele timer eller TT:MM)
         if intervals_raw:
             try:
                 for rng in intervals_raw.split(','):
-                    a, b = rng.strip().split('-')
-                    start_hour = int(a)
-                    end_hour = int(b)
+                    a, b = (_parse_boundary(part) for part in rng.strip().split('-'))
 
                     # Håndter 24-timers intervaller (f.eks. 7-7)
-                    if start_hour == end_hour:
-                        intervals_list.append(["24t", start_hour, start_hour])
+                    if a == b:
+                        intervals_list.append(["24t", a, b])
                     else:
-                        intervals_list.append(["brugerdefineret", start_hour, end_hour])
+                        intervals_list.append(["brugerdefineret", a, b])
 
+                # Samme kompilerede tabel som planlægningen bruger afviser ugyldige grænser
+                table = compile_intervals(intervals_list, use_custom_intervals=True)
             except ValueError:
-                messagebox.showerror("Interval-fejl", "Format skal være fx 07-15,15-23,23-07")
+                messagebox.showerror("Interval-fejl", "Format skal være fx 07-15,15-22:30,22:30-07")
+                return
+            if table.gaps and not messagebox.askokcancel(
+                    "Interval-advarsel",
+                    "Intervallerne dækker ikke hele døgnet – udækket tid får label 'ukendt'. Fortsæt?"):
                 return
 
         # Tjek om intervallerne matcher standardværdierne
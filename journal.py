@@ -0,0 +1,104 @@
+"""journal.py
+Genoptagelses-journal for pipelinen.
+
+Hver blok der behandles registreres som én JSON-linje i output-mappen med
+output_filename, en hash af blokkens plan og udfaldet. Linjerne tilføjes kun
+(append-only) og fsync'es, så journalen overlever at programmet eller maskinen
+går ned midt i en kørsel. Ved genstart springes blokke over, hvis journalen
+siger de er gemt med samme plan, og resultatfilen faktisk ligger i output-mappen.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_NAME = "kubios_journal.jsonl"
+
+
+def plan_hash(block: Dict[str, Any]) -> str:
+    """
+    Hash af alt der bestemmer blokkens resultat (samples, tider og filnavn),
+    så en ændret opdeling ikke fejlagtigt regnes som allerede gemt
+    """
+    payload = json.dumps({
+        "output_filename": block["output_filename"],
+        "file_length": block.get("file_length"),
+        "samples": block["samples"],
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class RunJournal:
+    """Append-only journal over behandlede blokke i en output-mappe"""
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / JOURNAL_NAME
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.result_names: List[str] = []
+        self.reload()
+
+    def reload(self) -> None:
+        """Læser journalen (seneste linje pr. blok vinder) og scanner output-mappen"""
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # En halvt skrevet sidste linje efter et nedbrud ignoreres
+                        logger.warning(f"Journal: ugyldig linje {line_no} i {self.path} ignoreres")
+                        continue
+                    self.entries[entry["output_filename"]] = entry
+        try:
+            self.result_names = [name for name in os.listdir(self.output_dir) if name != JOURNAL_NAME]
+        except OSError:
+            self.result_names = []
+
+    def has_result_file(self, output_filename: str) -> bool:
+        """
+        Findes der en gemt resultatfil for blokken? Kubios tilføjer selv endelsen,
+        så der matches på præfiks – men "..._1_of_1" må ikke matche "..._1_of_10"
+        """
+        n = len(output_filename)
+        return any(name.startswith(output_filename) and not name[n:n + 1].isdigit()
+                   for name in self.result_names)
+
+    def is_done(self, block: Dict[str, Any]) -> bool:
+        entry = self.entries.get(block["output_filename"])
+        return (entry is not None
+                and entry.get("outcome") == "success"
+                and entry.get("plan_hash") == plan_hash(block)
+                and self.has_result_file(block["output_filename"]))
+
+    def pending(self, blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Blokke der stadig mangler at blive gemt"""
+        return [blk for blk in blocks if not self.is_done(blk)]
+
+    def record(self, block: Dict[str, Any], outcome: str, error: str | None = None) -> None:
+        """Tilføjer en linje og tvinger den ned på disken før der fortsættes"""
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "output_filename": block["output_filename"],
+            "plan_hash": plan_hash(block),
+            "outcome": outcome,
+        }
+        if error:
+            entry["error"] = error
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[block["output_filename"]] = entry
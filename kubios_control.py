@@ -1,130 +1,365 @@
 """kubios_control.py
 Dette modul styrer åbning, lukning og fokus af Kubios
 
+KubiosSession holder på Popen-handle, process-ID og hovedvinduets handle, så
+Kubios ikke skal findes igen ved hvert kald. Cachen valideres billigt (psutil
+is_running / IsWindow) og genopslås kun når den er forældet.
 """
 
+import ctypes
+import json
 import os
+import socket
 import subprocess
 import psutil
 import time
+from datetime import datetime
 #pywinauto biblioteket fungerer kun i Windows
 from pywinauto.findwindows import find_windows
 from pywinauto import Desktop
 from pywinauto.findwindows import ElementNotFoundError
+import win32gui
+from screen_match import reset_anchors
+from timing_model import get_timing_model
+import tracing
 from config import (
 KUBIOS_PATH,
-STARTUP_DELAY,
+STARTUP_TIMEOUT,
+STARTUP_TIMINGS_FILE,
 PROCESS_NAME,
-TITLE_KEYWORD)
+TITLE_KEYWORD,
+KUBIOS_MAX_RSS_MB,
+KUBIOS_MAX_HANDLES)
 import logging
 
 #Modul til åbning, lukning, og styring af vinduet
 
+WM_NULL = 0x0000
+SMTO_ABORTIFHUNG = 0x0002
 
-def is_kubios_running(process_name=PROCESS_NAME):
-    #Funktion der tester om Kubios kører
-    for proc in psutil.process_iter(['pid','name']):
-        if process_name.lower() in proc.info['name'].lower():
-            logging.info("Kubios is running")
-            return True
-    logging.info("Kubios is not running")
-    return False
 
-def get_pid_by_name(process_name=PROCESS_NAME):
-    #Returnerer process-ID for første process der matcher process_name
+def is_window_responsive(handle, timeout_ms=500):
+    #Et vindue er klar når det er synligt og besvarer en WM_NULL-besked inden for timeout_ms
+    if not handle or not win32gui.IsWindowVisible(handle):
+        return False
+    result = ctypes.c_size_t()
+    return bool(ctypes.windll.user32.SendMessageTimeoutW(handle, WM_NULL, 0, 0, SMTO_ABORTIFHUNG,
+                                                         timeout_ms, ctypes.byref(result)))
+
+
+def record_startup_timing(timing, path=STARTUP_TIMINGS_FILE):
+    #Tilføjer én linje med opstartstider, så man kan se hvor tiden går på hver arbejdsstation
+    entry = {"time": datetime.now().isoformat(timespec="seconds"), "host": socket.gethostname(), **timing}
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        logging.warning(f"Could not write startup timing: {e}")
+
+
+def _find_processes(process_name=PROCESS_NAME):
+    #Gennemsøger alle processer og returnerer dem der matcher process_name
+    matches = []
     for proc in psutil.process_iter(['pid','name']):
         name = proc.info.get('name')
         if name and process_name.lower() in name.lower():
-            return proc.pid
-    return None
+            matches.append(proc)
+    return matches
 
 
+class KubiosSession:
+    #Ejer Kubios-processen og dens hovedvindue for hele pipelinen
 
+    def __init__(self, kubios_path=KUBIOS_PATH, process_name=PROCESS_NAME, title_keyword=TITLE_KEYWORD):
+        self.kubios_path = kubios_path
+        self.process_name = process_name
+        self.title_keyword = title_keyword
+        self.popen = None          # Handle fra subprocess.Popen (kan være en launcher)
+        self._proc = None          # psutil.Process for kubioshrv
+        self._window_handle = None # Hovedvinduets handle
+        self.process_scans = 0     # Antal fulde process-gennemløb (til logning)
 
-def bring_kubios_to_front(process_name=PROCESS_NAME, title_keyword=TITLE_KEYWORD):
-    #Trækker Kubios frem med pywinauto
-    pid = get_pid_by_name(process_name)
-    if not pid:
-        logging.warning(f"No process found with the name '{process_name}'")
+    def invalidate(self):
+        self._proc = None
+        self._window_handle = None
+
+    @property
+    def process(self):
+        #Cachet psutil.Process; is_running() fanger også genbrugte PID'er via create_time
+        if self._proc is not None:
+            try:
+                if self._proc.is_running() and self._proc.status() != psutil.STATUS_ZOMBIE:
+                    return self._proc
+            except psutil.Error:
+                pass
+            self.invalidate()
+        self.process_scans += 1
+        matches = _find_processes(self.process_name)
+        self._proc = matches[0] if matches else None
+        return self._proc
+
+    @property
+    def pid(self):
+        proc = self.process
+        return proc.pid if proc else None
+
+    def is_running(self):
+        return self.process is not None
+
+    def main_window(self, strict=False):
+        #Returnerer hovedvinduets handle og slår det kun op igen hvis det ikke længere findes
+        #Med strict=True returneres kun et vindue hvis titel indeholder title_keyword
+        #Kun et vindue med title_keyword i titlen caches; ellers returneres første vindue uden at blive husket,
+        #så en splash-skærm eller dialog ikke bliver brugt som hovedvindue resten af sessionen
+        if self._window_handle is not None and win32gui.IsWindow(self._window_handle):
+            return self._window_handle
+        self._window_handle = None
+        pid = self.pid
+        if not pid:
+            return None
+        handles = find_windows(process=pid, backend="uia")
+        fallback = None
+        for handle in handles:
+            title = win32gui.GetWindowText(handle)
+            if self.title_keyword.lower() in title.lower():
+                self._window_handle = handle
+                return handle
+            if fallback is None:
+                fallback = handle
+                logging.info(f"Not able to find main window. Found window: {title}")
+        if strict:
+            return None
+        return fallback
+
+    def wait_until_ready(self, started_at=None, deadline=STARTUP_TIMEOUT,
+                         initial_interval=0.1, max_interval=2.0, reason="launch"):
+        #Poller med eksponentiel backoff indtil hovedvinduet findes og svarer, eller deadline nås
+        #Tiderne (process fundet, vindue fundet, klar) gemmes i STARTUP_TIMINGS_FILE
+        started_at = started_at if started_at is not None else time.monotonic()
+        interval = initial_interval
+        timing = {"reason": reason, "process_s": None, "window_s": None, "ready_s": None, "polls": 0}
+        ready = False
+        while True:
+            elapsed = time.monotonic() - started_at
+            timing["polls"] += 1
+            if timing["process_s"] is None and self.is_running():
+                timing["process_s"] = round(elapsed, 3)
+            if timing["process_s"] is not None:
+                handle = self.main_window(strict=True)
+                if handle and timing["window_s"] is None:
+                    timing["window_s"] = round(elapsed, 3)
+                if handle and is_window_responsive(handle):
+                    timing["ready_s"] = round(time.monotonic() - started_at, 3)
+                    ready = True
+                    break
+            remaining = deadline - (time.monotonic() - started_at)
+            if remaining <= 0:
+                break
+            tracing.sleep(min(interval, remaining))
+            interval = min(interval * 2, max_interval)
+
+        if ready:
+            logging.info(f"Kubios ready after {timing['ready_s']:.1f}s "
+                         f"(process {timing['process_s']}s, window {timing['window_s']}s)")
+        else:
+            logging.warning(f"Kubios not ready within {deadline}s: {timing}")
+        record_startup_timing({**timing, "ready": ready})
+        return ready
+
+    def bring_to_front(self, title_keyword=None):
+        #Trækker Kubios frem med pywinauto. Med et andet title_keyword (fx "error") søges blandt alle vinduer
+        if not self.pid:
+            logging.warning(f"No process found with the name '{self.process_name}'")
+            return False
+        try:
+            if title_keyword is None or title_keyword.lower() == self.title_keyword.lower():
+                handles = [self.main_window()]
+            else:
+                handles = find_windows(process=self.pid, backend="uia")
+                handles.sort(key=lambda h: title_keyword.lower() not in win32gui.GetWindowText(h).lower())
+            handles = [h for h in handles if h]
+            if not handles:
+                logging.info(f"No window found with the name '{self.process_name}'")
+                return False
+
+            for handle in handles:
+                win = Desktop(backend="uia").window(handle=handle)
+                try:
+                    tracing.sleep(0.2)
+                    win.restore()
+                    tracing.sleep(0.2)
+                    win.set_focus()
+                    logging.info(f"Kubios window brought to front: '{win.window_text()}'")
+                    return True
+                except ElementNotFoundError:
+                    logging.error(f"No window found with handle '{handle}'")
+                    self._window_handle = None
+                except Exception as e:
+                    logging.error(f"Failed to bring window to front: {e}")
+                    continue
+        except Exception as e:
+            logging.error(f"Error: {e}")
+            return False
         return False
-    try:
-        #Ny variabel med værdi for process-ID af valgte title_keyword
-        window_handles = find_windows(process=pid, backend="uia")
 
-        if not window_handles:
-            logging.info(f"No window found with the name '{process_name}'")
+    @tracing.traced("open_kubios")
+    def open(self, kubios_path=None):
+        kubios_path = kubios_path or self.kubios_path
+        if self.is_running():
+            logging.info("Kubios is already running")
+            if not self.wait_until_ready(reason="already_running"):
+                logging.error("Kubios is running but its main window never became responsive")
+                return False
+            return self.bring_to_front()
+
+        if not os.path.exists(kubios_path):
+            logging.info(f"Path: {kubios_path} does not exist")
             return False
 
-        #Lister med vinduer
-        matching_windows = []
-        fallback_windows = []
-
-        for handle in window_handles:
-            win = Desktop(backend="uia").window(handle=handle)
-            title = win.window_text()
-            print(f"Title_keyword : {str(title_keyword)}")
-            print(f" title: {str(title)}")
-            if title_keyword.lower() in title.lower():
-                matching_windows.append(win)
-            else:
-                fallback_windows.append(win)
-                logging.info(f"Not able to find main window. Found window: {title}" )
+        logging.info(f"Attempting to start Kubios")
+        model = get_timing_model()
+        ready = False
+        try:
+            for open_try in range(3):
+                started_at = time.monotonic()
+                self.popen = subprocess.Popen([str(kubios_path)], stdin=subprocess.DEVNULL,
+                                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                # Fristen læres af timing-modellen; STARTUP_TIMEOUT indtil der er målinger nok
+                deadline = model.timeout("kubios_startup", STARTUP_TIMEOUT)
+                ready = self.wait_until_ready(started_at, deadline=deadline, reason=f"launch_{open_try + 1}")
+                if ready:
+                    model.record("kubios_startup", time.monotonic() - started_at)
+                    break
+                model.record("kubios_startup", deadline)
+                if self.is_running():
+                    # Processen kører men svarer ikke endnu – start ikke en instans mere
+                    logging.warning("Kubios is running but main window is not responsive yet")
+                    break
+            if not ready:
+                logging.error(f"Kubios did not become ready after {open_try + 1} attempts")
+                return False
+            logging.info("Kubios has been started")
+            return True
+        except Exception as e:
+            logging.error(f"Failed to start Kubios: {e}")
+            return False
 
-        #Denne del af koden åbner Kubios
-        for win in matching_windows + fallback_windows:
+    @tracing.traced("close_kubios")
+    def close(self, timeout=15):
+        #Afslutter alle Kubios-processer og venter på at de faktisk er lukket i stedet for en fast pause
+        procs = _find_processes(self.process_name)
+        self.process_scans += 1
+        if self.popen is not None and self.popen.poll() is None and \
+                self.popen.pid not in {proc.pid for proc in procs}:
             try:
-                time.sleep(0.2)
-                win.restore()
-                time.sleep(0.2)
-                win.set_focus()
-                logging.info(f"Kubios window brought to front: '{win.window_text()}'")
-                return True
-            except ElementNotFoundError:
-                logging.error(f"No window found with the name '{win.window_text()}'")
-            except Exception as e:
-                logging.error(f"Failed to bring window to front: {e}")
-                continue
-    except Exception as e:
-        logging.error(f"Error: {e}")
-        return False
-    return False
+                procs.append(psutil.Process(self.popen.pid))
+            except psutil.NoSuchProcess:
+                pass
+        self.invalidate()
+        # En ny instans kan lægge dialogerne andre steder, så ROI-ankrene gælder ikke længere
+        reset_anchors()
+        self.popen = None
+        if not procs:
+            logging.warning(f"No process found with the name '{self.process_name}'")
+            return False
+
+        for proc in procs:
+            logging.info(f"CLosing process: {self.process_name} (pid {proc.pid})")
+            try:
+                proc.terminate()
+            except psutil.NoSuchProcess:
+                pass
+        gone, alive = psutil.wait_procs(procs, timeout=timeout)
+        for proc in alive:
+            logging.warning(f"Process {proc.pid} did not exit within {timeout}s, killing it")
+            try:
+                proc.kill()
+            except psutil.NoSuchProcess:
+                pass
+        if alive:
+            psutil.wait_procs(alive, timeout=5)
+        return True
+
+
+_session = KubiosSession()
+
+
+def get_session():
+    #Den fælles session som hele pipelinen bruger
+    return _session
+
+
+def is_kubios_running(process_name=PROCESS_NAME):
+    #Funktion der tester om Kubios kører
+    running = _session.is_running() if process_name == _session.process_name else bool(_find_processes(process_name))
+    logging.info("Kubios is running" if running else "Kubios is not running")
+    return running
+
+def get_pid_by_name(process_name=PROCESS_NAME):
+    #Returnerer process-ID for første process der matcher process_name
+    if process_name == _session.process_name:
+        return _session.pid
+    matches = _find_processes(process_name)
+    return matches[0].pid if matches else None
+
+
+def bring_kubios_to_front(process_name=PROCESS_NAME, title_keyword=TITLE_KEYWORD):
+    #Trækker Kubios frem med pywinauto
+    if process_name == _session.process_name:
+        return _session.bring_to_front(title_keyword)
+    return KubiosSession(process_name=process_name, title_keyword=title_keyword).bring_to_front()
 
 def open_kubios(kubios_path=KUBIOS_PATH):
-    if is_kubios_running():
-        logging.info("Kubios is already running")
-        time.sleep(5)
-        return bring_kubios_to_front()
+    return _session.open(kubios_path)
+
+def close_kubios(process_name=PROCESS_NAME):
+    return _session.close()
 
-    if not os.path.exists(kubios_path):
-        logging.info(f"Path: {kubios_path} does not exist")
-        return False
 
-    logging.info(f"Attempting to start Kubios")
+def get_process_resources(process_name=PROCESS_NAME):
+    #Returnerer hukommelsesforbrug (RSS i MB) og antal handles for Kubios, eller None
+    pid = get_pid_by_name(process_name)
+    if not pid:
+        return None
     try:
-        for open_try in range(6):
+        proc = psutil.Process(pid)
+        rss_mb = proc.memory_info().rss / (1024 * 1024)
+        #num_handles findes kun på Windows, ellers bruges antal åbne fil-descriptorer
+        handles = proc.num_handles() if hasattr(proc, "num_handles") else proc.num_fds()
+        return {"rss_mb": rss_mb, "handles": handles}
+    except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+        logging.warning(f"Could not read Kubios resources: {e}")
+        return None
 
-            subprocess.Popen([kubios_path], stdin=subprocess.DEVNULL,
-                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            time.sleep(STARTUP_DELAY)
-            if is_kubios_running():
-                break
-        logging.info("Kubios has been started")
-        return True
-    except Exception as e:
-        logging.error(f"Failed to start Kubios: {e}")
+
+class RestartPolicy:
+    #Afgør om Kubios skal genstartes før næste blok ud fra ressourceforbrug og fejl
+
+    def __init__(self, max_rss_mb=KUBIOS_MAX_RSS_MB, max_handles=KUBIOS_MAX_HANDLES):
+        self.max_rss_mb = max_rss_mb
+        self.max_handles = max_handles
+        self.restarts = 0
+        self.avoided = 0
+
+    def should_restart(self, error_detected=False, process_name=PROCESS_NAME):
+        if error_detected:
+            logging.info("Restarting Kubios: error in previous block")
+            self.restarts += 1
+            return True
+        resources = get_process_resources(process_name)
+        if resources is None:
+            logging.info("Restarting Kubios: process not found or not readable")
+            self.restarts += 1
+            return True
+        if resources["rss_mb"] > self.max_rss_mb or resources["handles"] > self.max_handles:
+            logging.info(f"Restarting Kubios: {resources['rss_mb']:.0f} MB RSS, {resources['handles']} handles "
+                         f"(limits {self.max_rss_mb} MB, {self.max_handles} handles)")
+            self.restarts += 1
+            return True
+        logging.info(f"Keeping Kubios running: {resources['rss_mb']:.0f} MB RSS, {resources['handles']} handles")
+        self.avoided += 1
         return False
 
-def close_kubios(process_name=PROCESS_NAME):
-    found = False
-    for proc in psutil.process_iter(['pid','name']):
-        if process_name.lower() in proc.info.get('name').lower():
-            logging.info(f"CLosing process: {process_name}")
-            proc.terminate()
-            time.sleep(5)
-    if not found:
-        logging.warning(f"No process found with the name '{process_name}'")
-        found = True
-    return found
 
 if __name__ == "__main__":
     open_kubios()
\ No newline at end of file
@@ -3,28 +3,84 @@ Hovedprogram der koordinerer HRV-analyse pipelinen.
 main.py"""
 
 from __future__ import annotations
-import logging, time
+import logging
 from pathlib import Path
 from typing import Dict, List, Any
 from tkinter import messagebox
 import pyautogui
 
-from config import CONFIG, LOG_FILE, DAY_INTERVALS, MAX_SAMPLES_PER_FILE
+from config import CONFIG, BATCHED_SAMPLE_ENTRY, TRACE_FILE
 from file_io import read_edf_list, resolve_edf_paths
-from kubios_control import open_kubios, bring_kubios_to_front, close_kubios
+from kubios_control import get_session, RestartPolicy
 from analysis_driver import (open_edf_file, perform_read,
                              detect_analysis_error, read_time_and_length, detect_analysis_window, detect_save_dialog,
-                             detect_open_data_file)
-from sample_and_saver import add_sample, save_results
+                             detect_open_data_file, processing_stats, collect_digit_samples)
+from sample_and_saver import add_sample, add_samples_batched, save_results
 from analysis_logic import split_samples, td_to_str, str_to_td
+from metadata_store import MetadataStore
+from planner import split_options
+from journal import RunJournal
+from screen_match import get_anchor_cache, load_templates
+from screen_capture import get_frame_cache
+from text_entry import stats as text_entry_stats
+from timing_model import get_timing_model
+import tracing
 
-# Opsæt logning til fil
-logging.basicConfig(filename=LOG_FILE,
-                    level=logging.INFO,
-                    format="%(asctime)s %(levelname)s %(name)s  %(message)s")
 logger = logging.getLogger(__name__)
 
 
+def read_recording_times(edf: Path, store: MetadataStore) -> tuple[str, str, str] | tuple[None, None, None]:
+    """
+    Starttid, varighed og kilde ("header" eller "ocr") fra metadata-lageret, ellers fra EDF-headeren.
+    Returnerer (None, None, None) hvis ingen af delene har dem, så OCR skal bruges
+    """
+    info = store.lookup(edf)
+    if info is None:
+        logger.warning(f"Ingen gemte metadata og ulæselig EDF-header for {edf.name}, bruger OCR")
+        return None, None, None
+    logger.info(f"Metadata for {edf.name} fra {info.source} (gemt {info.recorded})")
+    return info.start, info.duration, info.source
+
+
+@tracing.traced("ocr")
+def read_recording_times_ocr() -> tuple[str, str]:
+    """Læser starttid og varighed fra Kubios-vinduet med OCR (fallback)"""
+    start_str, length_str = None, None
+    for ocr_try in range(15):
+        start_str, length_str = read_time_and_length()
+        if start_str and length_str:
+            return start_str, length_str  # OCR succesfuld
+        logger.warning(f"OCR forsøg {ocr_try+1} fejlede, prøver igen...")
+        tracing.sleep(4)
+    # OCR fejlede efter alle forsøg
+    raise RuntimeError(f"OCR fejlede: Start: {start_str}, Længde: {length_str}. Kan være ukendt filtype")
+
+
+def log_sample_timings(block_name: str, timings: Dict[str, float], sample_count: int) -> None:
+    """
+    Logger tiden pr. trin for en bloks samples. Genberegning er alle ventetider på
+    "processing"; ved batch-indtastning anslås besparelsen som de forventede ventetider
+    uden batch-indtastning (to pr. sample á den gennemsnitlige ventetid i denne eller
+    tidligere kørsler) minus de ventetider der faktisk blev målt i batchen
+    """
+    wait_keys = ("range_wait", "label_wait", "final_wait")
+    recompute = sum(timings.get(k, 0.0) for k in wait_keys)
+    entry = sum(v for k, v in timings.items() if k not in wait_keys)
+    steps = ", ".join(f"{k} {v:.1f}s" for k, v in timings.items())
+    message = (f"Blok {block_name}: {sample_count} samples, indtastning {entry:.1f}s, "
+               f"genberegning {recompute:.1f}s ({steps})")
+    avg_wait = processing_stats.average("processing_sample")
+    if avg_wait is None:
+        # Alle blokke i kørslen er batch-indtastet; brug medianen fra tidligere kørsler
+        avg_wait = get_timing_model().percentile("processing_sample", 50)
+    if "final_wait" in timings and avg_wait is not None:
+        expected = 2 * sample_count * avg_wait
+        saved = max(expected - recompute, 0.0)
+        message += (f", anslået sparet genberegning {saved:.1f}s (skøn: {2 * sample_count} ventetider á "
+                    f"{avg_wait:.1f}s uden batch-indtastning = {expected:.1f}s, målt {recompute:.1f}s)")
+    logger.info(message)
+
+
 def run_pipeline(cfg: Dict[str, str | List]) -> None:
     """
     Hovedfunktion der kører hele HRV-analyse pipelinen.
@@ -40,14 +96,37 @@ def run_pipeline(cfg: Dict[str, str | List]) -> None:
     output_dir = Path(cfg["output_dir"]).resolve()
     output_dir.mkdir(parents=True, exist_ok=True)  # Opret output-directory hvis det ikke eksisterer
     kubios_exe = Path(cfg["kubios_path"])
-    intervals = cfg.get("day_intervals", DAY_INTERVALS)
 
-    # Få brugerdefinerede samplevinduer fra konfiguration hvis brugeren specificerede dem
-    sample_windows = cfg.get("sample_windows", None)
+    # Intervaller, samplevinduer mv. fra konfigurationen (samme som planner.py bruger)
+    options = split_options(cfg)
+
+    # Indtast samples uden genberegning imellem og vent én gang til sidst
+    batched_entry = cfg.get("batched_sample_entry", BATCHED_SAMPLE_ENTRY)
 
     # Spor resultater til endelig sammenfatning
     success_blocks = []  # Liste over succesfuldt behandlede bloknavne
     failed_blocks = []   # Liste over ordbøger med fejldetaljer
+    skipped_blocks = []  # Blokke der allerede var gemt i en tidligere kørsel
+
+    # Journal over gemte blokke, så en afbrudt kørsel kan genoptages
+    journal = RunJournal(output_dir)
+
+    # Starttid/varighed fra tidligere kørsler (header eller OCR), så en genkørsel ikke kræver OCR
+    metadata_store = MetadataStore()
+
+    # Kubios genstartes kun mellem blokke når hukommelse/handles eller en fejl kræver det
+    restart_policy = RestartPolicy()
+
+    # Én session ejer Kubios-processen og hovedvinduet gennem hele kørslen
+    session = get_session()
+    session.kubios_path = kubios_exe
+
+    # Alle skabeloner indlæses én gang, så den første søgning efter hver knap ikke læser fra disk
+    logger.info(f"Indlæste {load_templates()} skabeloner")
+
+    # Spans for hvert trin skrives til TRACE_FILE; sammenfatningen logges til sidst
+    run_id = tracing.start_tracing()
+    logger.info(f"Trace {run_id} skrives til {TRACE_FILE}")
 
     # Læs liste over EDF-filer der skal behandles fra Excel-fil
     edf_names = read_edf_list(excel_path)
@@ -56,64 +135,78 @@ def run_pipeline(cfg: Dict[str, str | List]) -> None:
     # Behandl hver EDF-fil
     for edf in edf_paths:
         pid = edf.stem  # Patient ID fra filnavn
-        start_str, length_str = None, None  # Vil indeholde OCR-resultater
+        start_str, length_str = None, None  # Vil indeholde header- eller OCR-resultater
         blocks = []  # Vil indeholde analyseblokke for denne fil
+        pending_blocks = []  # Blokke der ikke allerede er gemt ifølge journalen
 
+        recording_span = tracing.start_span("recording", patient_id=pid)
         try:
             logger.info("=== Starter analyse af %s ===", pid)
 
-            # Åbn Kubios software og indlæs EDF-filen
-            open_kubios(kubios_exe)
-            time.sleep(4)  # Vent på at Kubios fuldt indlæses
-            bring_kubios_to_front()
-            open_edf_file(edf)
-
-            # Brug OCR til at læse optagelsens starttid og varighed fra Kubios
-            for ocr_try in range(15):
-                start_str, length_str = read_time_and_length()
-                if start_str and length_str:
-                    break  # OCR succesfuld
-                logger.warning(f"OCR forsøg {ocr_try+1} fejlede, prøver igen...")
-                time.sleep(4)
-            else:
-                # OCR fejlede efter alle forsøg
-                raise RuntimeError(f"OCR fejlede: Start: {start_str}, Længde: {length_str}. Kan være ukendt filtype")
-
-            logger.info(f"OCR data: start: {start_str}, længde: {length_str}")
+            # Læs starttid og varighed fra metadata-lageret eller EDF-headeren
+            start_str, length_str, times_source = read_recording_times(edf, metadata_store)
 
-            # Opdel optagelsen i analyseblokke baseret på tidsintervaller
-            use_custom_intervals = cfg.get("use_custom_intervals", False)
-            intervals_param = None if not use_custom_intervals else intervals
+            if start_str and length_str:
+                logger.info(f"Optagelse: start: {start_str}, længde: {length_str}")
+                # Opdel optagelsen i analyseblokke baseret på tidsintervaller
+                blocks = split_samples(start_str, length_str, pid, **options)
+                pending_blocks = journal.pending(blocks)
 
-            blocks = split_samples(
-                start_str,
-                length_str,
-                pid,
-                MAX_SAMPLES_PER_FILE,
-                intervals=intervals_param,
-                sample_windows=sample_windows,
-                use_custom_intervals=use_custom_intervals
-            )
+                # Åbn kun Kubios hvis der stadig er blokke der mangler at blive gemt
+                if not pending_blocks:
+                    logger.info(f"Alle {len(blocks)} blokke for {pid} er allerede gemt – springer filen over")
+                    skipped_blocks.extend(blk["output_filename"] for blk in blocks)
+                    continue
 
-            logger.info(f"Genererede {len(blocks)} blokke for {pid}")
+            # Åbn Kubios software og indlæs EDF-filen
+            if not session.open(kubios_exe):  # Returnerer når hovedvinduet svarer
+                raise RuntimeError("Kubios kunne ikke startes")
+            session.bring_to_front()
+            open_edf_file(edf)
 
-            # Behandl hver blok
-            for blk_idx, blk in enumerate(blocks):
+            if not blocks:
+                # Brug OCR til at læse optagelsens starttid og varighed fra Kubios
+                start_str, length_str = read_recording_times_ocr()
+                logger.info(f"OCR data: start: {start_str}, længde: {length_str}")
+                blocks = split_samples(start_str, length_str, pid, **options)
+                # Gemmes først når split_samples har godtaget værdierne, så en fejllæsning ikke caches,
+                # og med det samme, da OCR er dyr at gentage
+                metadata_store.put(edf, start_str, length_str, "ocr")
+                metadata_store.save()
+                pending_blocks = journal.pending(blocks)
+            elif times_source == "header":
+                # Headerens værdier er facit, så felternes udsnit kan bruges til glyf-skabelonerne
+                collect_digit_samples(start_str, length_str)
+
+            logger.info(f"Genererede {len(blocks)} blokke for {pid}, {len(pending_blocks)} mangler")
+            for blk in blocks:
+                if blk not in pending_blocks:
+                    logger.info(f"Springer allerede gemt blok over: {blk['output_filename']}")
+                    skipped_blocks.append(blk["output_filename"])
+
+            # Behandl hver blok der mangler
+            previous_block_failed = False
+            for blk_idx, blk in enumerate(pending_blocks):
                 block_name = blk["output_filename"]
 
+                block_span = tracing.start_span("block", block=block_name, block_index=blk_idx + 1)
                 try:
-                    logger.info(f"=== Behandler blok {blk_idx + 1}/{len(blocks)}: {block_name} ===")
+                    logger.info(f"=== Behandler blok {blk_idx + 1}/{len(pending_blocks)}: {block_name} ===")
 
-                    # For blokke efter den første, genstart Kubios for at undgå hukommelsesproblemer
+                    # For blokke efter den første genstartes Kubios kun hvis hukommelsen/handles
+                    # er for høje eller forrige blok fejlede; ellers genåbnes filen i den kørende Kubios
                     if blk_idx > 0:
-                        logger.info("Genstarter Kubios for ny blok")
-                        close_kubios()
-                        time.sleep(3)
-                        open_kubios(kubios_exe)
-                        time.sleep(4)
-                        bring_kubios_to_front()
+                        if restart_policy.should_restart(error_detected=previous_block_failed):
+                            logger.info("Genstarter Kubios for ny blok")
+                            with tracing.span("restart"):
+                                session.close()
+                                if not session.open(kubios_exe):
+                                    raise RuntimeError("Kubios kunne ikke genstartes")
+                        else:
+                            logger.info("Indlæser ny blok i den kørende Kubios")
+                        session.bring_to_front()
                         open_edf_file(edf)
-                        time.sleep(2)
+                    previous_block_failed = False
 
                     # Få timing-information for denne blok
                     first = blk["samples"][0]
@@ -128,33 +221,41 @@ def run_pipeline(cfg: Dict[str, str | List]) -> None:
                     # Tjek om vi skal læse alle data (når blokken dækker hele optagelsen)
                     read_all = (block_start_str == "00:00:00" and block_end_str == length_str)
 
-                    # Håndter Kubios-dialog hvis den vises
+                    # Vent på at Kubios viser 'åbn datafil'-dialogen
                     if detect_open_data_file():
                         logger.info("Detekterede 'åbn datafil' vindue")
 
                     # Fortæl Kubios at læse dataene for dette tidsområde
-                    perform_read(read_all, block_start_str, block_end_str if not read_all else None)
-                    time.sleep(2)
-
-                    # Vent på at Kubios-analysevinduet vises
-                    analysis_window_detected = False
-                    for detection_try in range(10):
-                        if detect_analysis_window():
-                            logger.info("Analysevindue detekteret")
-                            analysis_window_detected = True
-                            break
-                        time.sleep(1)
-
-                    if not analysis_window_detected:
+                    if not perform_read(read_all, block_start_str, block_end_str if not read_all else None):
+                        raise RuntimeError("Indlæsning af blokkens tidsområde fejlede")
+
+                    # Vent på at Kubios-analysevinduet vises (fejl-dialoger lukkes undervejs)
+                    if detect_analysis_window():
+                        logger.info("Analysevindue detekteret")
+                    else:
                         logger.warning("Fejlede i at detektere analysevindue, fortsætter alligevel")
 
                     # Tilføj alle samples for denne blok til Kubios
                     logger.info(f"Tilføjer {len(blk['samples'])} samples til blok {block_name}")
-                    for smp_idx, smp in enumerate(blk["samples"]):
-                        sample_info = f"Sample {smp['index']}: {smp['label']} ({smp['start_time']}, {smp['length']})"
-                        logger.info(f"Tilføjer {sample_info}")
-                        add_sample(smp["start_time"], smp["length"], smp["index"], smp["label"])
-                        time.sleep(0.5)  # Kort pause mellem samples
+                    added_samples = 0
+                    if batched_entry:
+                        # add_samples_batched rejser ved første sample der ikke kan tilføjes
+                        log_sample_timings(block_name, add_samples_batched(blk["samples"]), len(blk["samples"]))
+                        added_samples = len(blk["samples"])
+                    else:
+                        timings = {}
+                        for smp_idx, smp in enumerate(blk["samples"]):
+                            sample_info = f"Sample {smp['index']}: {smp['label']} ({smp['start_time']}, {smp['length']})"
+                            logger.info(f"Tilføjer {sample_info}")
+                            if not add_sample(smp["start_time"], smp["length"], smp["index"], smp["label"], timings=timings):
+                                raise RuntimeError(f"Sample {smp['index']} ({smp['label']}) kunne ikke tilføjes")
+                            added_samples += 1
+                            tracing.sleep(0.5)  # Kort pause mellem samples
+                        log_sample_timings(block_name, timings, len(blk["samples"]))
+
+                    # En blok med manglende samples må hverken gemmes eller registreres som færdig
+                    if added_samples != len(blk["samples"]):
+                        raise RuntimeError(f"Kun {added_samples} af {len(blk['samples'])} samples blev tilføjet")
 
                     # Log diagnostisk information om det sidste sample
                     last_sample = blk["samples"][-1]
@@ -168,19 +269,25 @@ def run_pipeline(cfg: Dict[str, str | List]) -> None:
                     logger.info(f"Sidste sample diagnostik - Slut: {td_to_str(last_sample_end)}, Optagelse slut: {td_to_str(recording_absolute_end)}, Overskrider: {last_sample_end > recording_absolute_end}")
 
                     # Gem analyseresultaterne for denne blok som Excel-fil
-                    save_results(str(output_dir), block_name)
+                    if not save_results(str(output_dir), block_name):
+                        raise RuntimeError("Gem af resultater fejlede")
                     logger.info(f"Succesfuldt gemt blok: {block_name}")
 
-                    # Registrer succesfuld blok
-                    success_blocks.append(block_name)
-
                     # Tjek om Kubios viste nogen fejlmeddelelser
                     if detect_analysis_error("error"):
                         raise RuntimeError("Kubios fejl-popup detekteret")
 
+                    # Blokken registreres først som succesfuld når alle samples er tilføjet,
+                    # resultaterne er gemt og Kubios ikke har vist fejl
+                    success_blocks.append(block_name)
+                    journal.record(blk, "success")
+
                 except Exception as block_exc:
                     # Denne blok fejlede - log detaljeret information
                     logger.exception(f"Blok {block_name} fejlede!")
+                    block_span.fail(block_exc)
+                    journal.record(blk, "failed", str(block_exc))
+                    previous_block_failed = True
 
                     # Indsaml information om alle samples i den fejlede blok
                     sample_details = []
@@ -204,19 +311,21 @@ def run_pipeline(cfg: Dict[str, str | List]) -> None:
 
                     # Fortsæt med at behandle andre blokke
                     continue
+                finally:
+                    tracing.end_span(block_span)
 
             # Luk Kubios efter behandling af alle blokke for denne fil
-            close_kubios()
-            time.sleep(2)
+            session.close()
             logger.info(f"Afsluttede behandling af alle blokke for {pid}")
 
         except Exception as file_exc:
             # Hele filen fejlede under opsætning eller OCR
             logger.exception(f"Fil {pid} fejlede under opsætning eller OCR!")
+            recording_span.fail(file_exc)
 
             # Markér alle blokke for denne fil som fejlede
             if blocks:
-                for blk in blocks:
+                for blk in pending_blocks:
                     block_name = blk["output_filename"]
                     sample_details = [f"Sample {s.get('index', '?')}: {s.get('label', 'Ukendt')}" for s in blk.get('samples', [])]
 
@@ -247,9 +356,10 @@ def run_pipeline(cfg: Dict[str, str | List]) -> None:
                 logger.error("Ingen samples genereret på grund af opsætningsfejl")
 
             # Sørg for at Kubios er lukket før fortsættelse
-            close_kubios()
-            time.sleep(5)
+            session.close()
             continue
+        finally:
+            tracing.end_span(recording_span)
 
     # Opret sammenfatning for brugeren der viser hvad der lykkedes og hvad der fejlede
     success_summary = "\n".join([f"  ✓ {block}" for block in success_blocks]) if success_blocks else "  Ingen"
@@ -283,13 +393,34 @@ SUCCESSFUL BLOCKS ({len(success_blocks)}):
 FAILED BLOCKS ({len(failed_blocks)}):
 {failure_summary}
 
+SKIPPED BLOCKS (already saved in an earlier run): {len(skipped_blocks)}
+
 SUMMARY: {len(success_blocks)} successful blocks, {len(failed_blocks)} failed blocks processed.
 Each successful block was saved as a separate Excel file in the output directory.
 """
 
     # Log the summary (single line for log file)
-    log_summary = f"Analysis complete: {len(success_blocks)} successful blocks, {len(failed_blocks)} failed blocks"
+    log_summary = (f"Analysis complete: {len(success_blocks)} successful blocks, {len(failed_blocks)} failed blocks, "
+                   f"{len(skipped_blocks)} skipped (already saved)")
     logger.info(log_summary)
+    logger.info(f"Kubios-genstarter mellem blokke: {restart_policy.restarts}, undgået: {restart_policy.avoided}")
+    logger.info(f"Fulde process-gennemløb i kørslen: {session.process_scans}")
+    logger.info(f"Processing-ventetid: {processing_stats.waits} ventetider, {processing_stats.seconds:.0f}s i alt, "
+                f"{processing_stats.saved_per_wait:.1f}s sparet pr. ventetid ({processing_stats.saved_seconds:.0f}s i alt)")
+    metadata_store.save()
+    logger.info(f"Metadata-lager: {metadata_store.hits} optagelser genbrugt, {metadata_store.misses} læst på ny")
+    logger.info(f"Tekstfelter: {text_entry_stats.pasted} indsat via udklipsholderen, "
+                f"{text_entry_stats.verified} verificeret, {text_entry_stats.fallbacks} skrevet tast for tast")
+    timing_model = get_timing_model()
+    timing_model.save()
+    for step, stats in sorted(timing_model.summary().items()):
+        logger.info(f"Timing {step}: n={stats['n']}, p50={stats['p50']:.1f}s, p99={stats['p99']:.1f}s")
+    frames = get_frame_cache()
+    logger.info(f"Skærmbilleder: {frames.captures} taget, {frames.served_from_cache} genbrugt fra cachen")
+    anchors = get_anchor_cache()
+    logger.info(f"Skabelon-ankre: {anchors.hits} fundet i ROI, {anchors.misses} forbi med fuld søgning")
+    tracing.log_summary()
+    tracing.stop_tracing()
 
     # Log successful blocks summary
     if success_blocks:
@@ -0,0 +1,132 @@
+"""metadata_store.py
+Vedvarende lager for optagelsernes starttid og varighed.
+
+En EDF-fils starttid og varighed ændrer sig aldrig, så når de først er læst (fra
+headeren eller med OCR i Kubios) gemmes de i edf_metadata_cache.json sammen med
+filens størrelse og mtime. Ved næste kørsel bruges de gemte værdier, så længe
+filen er uændret – en genkørsel af en kohorte kræver derfor ingen OCR.
+Nye værdier skrives til disk for hver SAVE_EVERY, og resten når kalderen kalder save().
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Tuple
+
+from config import EDF_METADATA_CACHE
+from edf_header import read_edf_metadata, UnsupportedEdfError
+
+logger = logging.getLogger(__name__)
+
+METADATA_CACHE_VERSION = 1
+SAVE_EVERY = 25  # Gem efter så mange nye optagelser, så en stor kohorte ikke skriver hele filen for hver
+
+
+@dataclass(frozen=True)
+class RecordingInfo:
+    """Starttid og varighed for én optagelse, og hvordan de blev fundet"""
+    start: str                  # "HH:MM:SS" (som split_samples forventer)
+    duration: str               # "HH:MM:SS"
+    source: str                 # "header" eller "ocr"
+    size: int
+    mtime_ns: int
+    file_format: str | None = None
+    channels: Tuple[str, ...] = field(default_factory=tuple)
+    recorded: str | None = None  # Hvornår værdierne blev gemt
+
+
+def _identity(edf_path) -> Tuple[str, int, int]:
+    stat = os.stat(edf_path)
+    return os.path.normcase(os.path.abspath(edf_path)), stat.st_size, stat.st_mtime_ns
+
+
+class MetadataStore:
+    """Optagelses-metadata pr. fil, gyldigt så længe sti, størrelse og mtime er uændret"""
+
+    def __init__(self, path=EDF_METADATA_CACHE):
+        self.path = Path(path)
+        self.entries: Dict[str, RecordingInfo] = {}
+        self.hits = 0
+        self.misses = 0
+        self._unsaved = 0
+        self.load()
+
+    def load(self) -> None:
+        self.entries = {}
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not read metadata cache '{self.path}': {e}")
+            return
+        if data.get("version") != METADATA_CACHE_VERSION:
+            return
+        for key, raw in data.get("files", {}).items():
+            try:
+                self.entries[key] = RecordingInfo(**{**raw, "channels": tuple(raw.get("channels", ()))})
+            except TypeError:
+                logger.warning(f"Ignoring invalid metadata cache entry for {key}")
+
+    def save(self) -> None:
+        """Gemmer atomisk, så en afbrudt kørsel ikke efterlader en halv fil"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        files = {key: {**asdict(info), "channels": list(info.channels)} for key, info in self.entries.items()}
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": METADATA_CACHE_VERSION, "files": files}, f, indent=1, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._unsaved = 0
+        except OSError as e:
+            logger.warning(f"Could not save metadata cache '{self.path}': {e}")
+
+    def get(self, edf_path) -> RecordingInfo | None:
+        """Gemte værdier hvis filen ikke er ændret siden de blev gemt"""
+        try:
+            key, size, mtime_ns = _identity(edf_path)
+        except OSError:
+            return None
+        info = self.entries.get(key)
+        if info is None or info.size != size or info.mtime_ns != mtime_ns:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return info
+
+    def put(self, edf_path, start: str, duration: str, source: str,
+            file_format: str | None = None, channels=()) -> RecordingInfo | None:
+        """Gemmer værdierne for filen; lageret skrives til disk for hver SAVE_EVERY nye værdier"""
+        try:
+            key, size, mtime_ns = _identity(edf_path)
+        except OSError as e:
+            logger.warning(f"Could not stat {edf_path} for metadata cache: {e}")
+            return None
+        info = RecordingInfo(start, duration, source, size, mtime_ns, file_format, tuple(channels),
+                             datetime.now().isoformat(timespec="seconds"))
+        self.entries[key] = info
+        self._unsaved += 1
+        if self._unsaved >= SAVE_EVERY:
+            self.save()
+        return info
+
+    def lookup(self, edf_path) -> RecordingInfo | None:
+        """
+        Gemte værdier, ellers læses EDF-headeren (og resultatet gemmes)
+        Returnerer None hvis headeren ikke kan læses, så OCR i Kubios er nødvendig
+        """
+        info = self.get(edf_path)
+        if info is not None:
+            return info
+        try:
+            metadata = read_edf_metadata(edf_path)
+        except (OSError, UnsupportedEdfError) as e:
+            logger.warning(f"Kunne ikke læse EDF-header for {Path(edf_path).name}: {e}")
+            return None
+        return self.put(edf_path, metadata.start_str, metadata.duration_str, "header",
+                        metadata.file_format, metadata.channels)
@@ -0,0 +1,193 @@
+"""planner.py
+Tør-kørsel af hele kohorten: finder alle EDF-filer, henter start/varighed fra
+metadata-lageret eller EDF-headeren og kører sample-opdelingen uden at starte Kubios.
+
+Resultatet er et manifest (JSON + CSV) med alle blokke, samples, fil-længder og
+output-filnavne, samt et estimat af den samlede Kubios-tid ud fra de målte trin-tider
+i timing-modellen (STEP_COST_SECONDS for trin der ikke er målt nok gange endnu).
+
+Kør fra kommandolinjen:
+    python planner.py [--config user_config.json] [--out manifest]
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+from config import (DAY_INTERVALS, MAX_SAMPLES_PER_FILE, STEP_COST_SECONDS, STEP_COST_SPANS,
+                    BLOCK_PARTITION, load_config)
+from file_io import read_edf_list, resolve_edf_paths_detailed
+from metadata_store import MetadataStore
+from analysis_logic import plan_samples, seconds_to_str, Block
+from timing_model import SPAN_STEP_PREFIX, get_timing_model
+
+logger = logging.getLogger(__name__)
+
+
+def split_options(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Oversætter konfigurationen til argumenter for split_samples/plan_samples,
+    så pipelinen og planneren altid opdeler optagelserne ens
+    """
+    use_custom_intervals = cfg.get("use_custom_intervals", False)
+    epoch_minutes = cfg.get("epoch_minutes")
+    return {
+        "max_samples_per_file": MAX_SAMPLES_PER_FILE,
+        "intervals": cfg.get("day_intervals", DAY_INTERVALS) if use_custom_intervals else None,
+        "sample_windows": cfg.get("sample_windows", None),
+        "use_custom_intervals": use_custom_intervals,
+        "epoch_seconds": int(float(epoch_minutes) * 60) if epoch_minutes else None,
+        "partition": cfg.get("block_partition", BLOCK_PARTITION),
+    }
+
+
+def learned_step_costs() -> Dict[str, float]:
+    """
+    Sekunder pr. trin: medianen af de målte varigheder i timing-modellen, eller
+    STEP_COST_SECONDS for trin der ikke er målt nok gange endnu
+    """
+    model = get_timing_model()
+    costs = dict(STEP_COST_SECONDS)
+    for step, span_name in STEP_COST_SPANS.items():
+        median = model.percentile(SPAN_STEP_PREFIX + span_name, 50)
+        if median is not None:
+            costs[step] = median
+    return costs
+
+
+def estimate_seconds(blocks: List[Block], step_costs: Dict[str, float] | None = None) -> float:
+    """
+    Anslår Kubios-tiden for én optagelse: opstart og indlæsning for første blok,
+    genstart for hver efterfølgende blok, og læsning, samples og gem for alle blokke
+    Uden step_costs bruges learned_step_costs()
+    """
+    if not blocks:
+        return 0.0
+    step_costs = step_costs if step_costs is not None else learned_step_costs()
+    startup = step_costs["open_kubios"] + step_costs["open_edf"]
+    total = startup + step_costs["close_kubios"]
+    total += (len(blocks) - 1) * (step_costs["close_kubios"] + startup)
+    for blk in blocks:
+        total += step_costs["read_block"] + step_costs["save_results"]
+        total += len(blk.samples) * step_costs["add_sample"]
+    return float(total)
+
+
+def plan_cohort(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Planlægger hele Excel-listen og returnerer manifestet som en ordbog
+    Starttid/varighed tages fra metadata-lageret (også OCR-resultater fra tidligere kørsler)
+    eller EDF-headeren. Filer uden nogen af delene markeres som "needs_ocr"
+    """
+    edf_names = read_edf_list(Path(cfg["excel_path"]))
+    edf_paths, duplicates, missing = resolve_edf_paths_detailed(Path(cfg["files_dir"]), edf_names)
+    options = split_options(cfg)
+    store = MetadataStore()
+    step_costs = learned_step_costs()
+
+    recordings = []
+    total_seconds = 0.0
+    total_blocks = 0
+    total_samples = 0
+    total_restarts_saved = 0
+    for edf in edf_paths:
+        pid = edf.stem
+        entry: Dict[str, Any] = {"patient_id": pid, "edf": str(edf)}
+        info = store.lookup(edf)
+        if info is None:
+            entry.update({"status": "needs_ocr", "blocks": []})
+            recordings.append(entry)
+            continue
+
+        blocks = plan_samples(info.start, info.duration, pid, **options)
+        greedy_blocks = plan_samples(info.start, info.duration, pid,
+                                     **{**options, "partition": "greedy"})
+        restarts_saved = len(greedy_blocks) - len(blocks)
+        total_restarts_saved += restarts_saved
+        seconds = estimate_seconds(blocks, step_costs)
+        total_seconds += seconds
+        total_blocks += len(blocks)
+        total_samples += sum(len(blk.samples) for blk in blocks)
+        entry.update({
+            "status": "planned",
+            "start_time": info.start,
+            "duration": info.duration,
+            "metadata_source": info.source,
+            "estimated_seconds": seconds,
+            "restarts_saved": restarts_saved,
+            "blocks": [blk.to_dict() for blk in blocks],
+        })
+        recordings.append(entry)
+    store.save()
+
+    return {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "excel_path": str(cfg["excel_path"]),
+        "files_dir": str(cfg["files_dir"]),
+        "step_costs": step_costs,
+        "totals": {
+            "recordings": len(edf_paths),
+            "blocks": total_blocks,
+            "samples": total_samples,
+            "needs_ocr": sum(1 for r in recordings if r["status"] == "needs_ocr"),
+            "missing": len(missing),
+            "restarts_saved": total_restarts_saved,
+            "estimated_seconds": total_seconds,
+            "estimated_duration": seconds_to_str(int(total_seconds)),
+        },
+        "missing": missing,
+        "duplicates": {name: [str(p) for p in paths] for name, paths in duplicates.items()},
+        "recordings": recordings,
+    }
+
+
+def write_manifest(manifest: Dict[str, Any], out_path) -> tuple[Path, Path]:
+    """
+    Skriver manifestet som <out_path>.json og én række pr. sample i <out_path>.csv
+    """
+    out_path = Path(out_path)
+    json_path = out_path.with_suffix(".json")
+    csv_path = out_path.with_suffix(".csv")
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["patient_id", "edf", "recording_start", "recording_length", "output_filename",
+                         "file_length", "block_start", "block_end", "sample_index", "label",
+                         "sample_start", "sample_length"])
+        for rec in manifest["recordings"]:
+            for blk in rec["blocks"]:
+                for smp in blk["samples"]:
+                    writer.writerow([rec["patient_id"], rec["edf"], rec.get("start_time", ""),
+                                     rec.get("duration", ""), blk["output_filename"], blk["file_length"],
+                                     smp["block_start_time"], smp["block_end_time"], smp["index"],
+                                     smp["label"], smp["start_time"], smp["length"]])
+
+    logger.info(f"Manifest skrevet til {json_path} og {csv_path}")
+    return json_path, csv_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Planlæg HRV-analyse uden at starte Kubios")
+    parser.add_argument("--config", default="user_config.json", help="Konfigurationsfil (som fra GUI'en)")
+    parser.add_argument("--out", default=None, help="Sti til manifest uden endelse (standard: output_dir/manifest)")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    out = args.out or Path(cfg["output_dir"]) / "manifest"
+    manifest = plan_cohort(cfg)
+    json_path, csv_path = write_manifest(manifest, out)
+    totals = manifest["totals"]
+    print(f"{totals['recordings']} optagelser, {totals['blocks']} blokke, {totals['samples']} samples")
+    print(f"Mangler: {totals['missing']}, kræver OCR: {totals['needs_ocr']}")
+    print(f"Anslået Kubios-tid: {totals['estimated_duration']} ({totals['restarts_saved']} genstarter sparet)")
+    print(f"Manifest: {json_path}, {csv_path}")
@@ -3,6 +3,7 @@ SAMPLE HÅNDTERING
 Dette modul håndterer tilføjelse af prøver og gemning af resultater i programmet
 """
 from pathlib import Path
+from typing import Any, Dict, List
 
 import pyautogui
 import logging
@@ -10,25 +11,48 @@ import time
 
 from PIL import ImageGrab, ImageOps
 
-from analysis_driver import click_center_left, click_right_of, click_right_upper, detect_save_dialog, \
-    detect_analysis_error, wait_for_window_closed
+from analysis_driver import click_center_left, click_right_of, click_right_upper, detect_save_dialog, settle, \
+    detect_analysis_error, wait_for_processing_done, wait_for_window_closed
+from screen_match import locate, locate_any, match_templates
+from screen_state import ScreenState, wait_for_state
+from text_entry import enter_text
+import tracing
 
 
+@tracing.traced("add_sample", sample="sample_number_in_sequence", label="sample_name")
 def add_sample(start_time: str, length_time: str, sample_number_in_sequence: int, sample_name: str,
                add_btn_imgs=None,
                start_field_img="assets/images/start_sample_field.png",
                length_field_img="assets/images/length_sample_field.png",
-               ok_cancel_img="assets/images/ok_cancel_add_sample.png") -> bool:
+               ok_cancel_img="assets/images/ok_cancel_add_sample.png",
+               wait_for_processing: bool = True,
+               timings: Dict[str, float] | None = None) -> bool:
     """
     Tilføjer et nyt sample til analysen
     - start_time: Hvornår prøven skal starte (i tid format)
     - length_time: Hvor lang prøven skal være
     - sample_number_in_sequence: Hvilket nummer prøven har i rækken
     - sample_name: Navn på prøven
+    - wait_for_processing: False springer ventetiderne på genberegning over (se add_samples_batched)
+    - timings: Hvis angivet, lægges tiden for hvert trin til (range, range_wait, label, label_wait)
     Returnerer True hvis det lykkedes, False hvis det fejlede
     """
+    timings = timings if timings is not None else {}
+    step_start = time.monotonic()
+
+    def step_done(name: str) -> None:
+        nonlocal step_start
+        now = time.monotonic()
+        timings[name] = timings.get(name, 0.0) + now - step_start
+        step_start = now
 
     try:
+        if not wait_for_processing and sample_number_in_sequence > 1:
+            # Forrige samples label-genberegning kører måske stadig; knappen kan ikke klikkes
+            # mens "processing"-vinduet er åbent. Tiden tælles som forrige samples label_wait
+            wait_for_window_closed("processing", hold_closed_seconds=0)
+            step_done("label_wait")
+
         # Hvis der ikke er angivet billeder til knapper, brug standard billeder
         if add_btn_imgs is None:
             add_btn_imgs = [
@@ -37,51 +61,41 @@ def add_sample(start_time: str, length_time: str, sample_number_in_sequence: int
                 "assets/images/add_remove_sample_blue.png"
             ]
 
-        # Find "add sample" knappen på skærmen
-        add_btn = None
-        for img in add_btn_imgs:
-            try:
-                add_btn = pyautogui.locateOnScreen(img, confidence=0.8)
-                if add_btn:
-                    break
-            except pyautogui.ImageNotFoundException:
-                continue
+        # Find "add sample" knappen på skærmen – alle varianter matches mod samme skærmbillede
+        _, add_btn = locate_any(add_btn_imgs)
 
         if not add_btn:
             raise RuntimeError(f"Kunne ikke finde 'tilføj prøve' knappen")
 
         # Hvis det ikke er den første prøve, klik på knappen for at åbne popup
         if sample_number_in_sequence > 1:
-            time.sleep(0.2)
+            settle("add_button", 0.2)
             click_center_left(add_btn)
-            time.sleep(0.2)
+            # Fortsæt så snart popup'en er genkendt i stedet for en fast pause
+            if wait_for_state({ScreenState.ADD_SAMPLE_POPUP}, timeout=10, step="add_sample_popup") is None:
+                raise RuntimeError("Popup'en til nyt sample blev ikke vist")
             # Skift til popup billeder
             start_field_img = "assets/images/add_sample_popup_start.png"
             length_field_img = "assets/images/add_sample_popup_length.png"
+        else:
+            settle("first_sample_fields", 0.7)
 
-        time.sleep(0.7)
+        # Find start- og længde-feltet på samme skærmbillede (layoutet ændres ikke under indtastning)
+        fields = match_templates([start_field_img, length_field_img])
+        start_field = fields[start_field_img][0] if fields[start_field_img] else None
+        length_field = fields[length_field_img][0] if fields[length_field_img] else None
 
-        # Find feltet hvor starttiden skal indtastes
-        try:
-            start_field = pyautogui.locateOnScreen(start_field_img, confidence=0.8)
-        except pyautogui.ImageNotFoundException:
+        if not start_field:
             logging.error("Kunne ikke finde start-felt billedet")
             raise RuntimeError(f"Kunne ikke finde start-felt billedet: {start_field_img}")
 
         # Klik på start-feltet og indtast starttiden
         click_right_of(start_field)
-        time.sleep(0.2)
+        settle("start_field_focus", 0.2)
         pyautogui.hotkey("ctrl", "a")  # Vælg alt tekst
-        time.sleep(0.1)
-        pyautogui.write(start_time, interval=0.01)  # Skriv starttiden
-        time.sleep(1)
-
-        # Find feltet hvor længden skal indtastes
-        try:
-            length_field = pyautogui.locateOnScreen(length_field_img, confidence=0.8)
-        except pyautogui.ImageNotFoundException:
-            logging.error("Kunne ikke finde længde-felt billedet")
-            raise RuntimeError(f"Kunne ikke finde længde-felt billedet: {length_field_img}")
+        settle("start_field_select", 0.1)
+        enter_text(start_time)  # Indsæt starttiden
+        settle("start_field_entered", 1)
 
         if not length_field:
             logging.error("Kunne ikke finde længde-felt billedet")
@@ -89,33 +103,34 @@ def add_sample(start_time: str, length_time: str, sample_number_in_sequence: int
 
         # Klik på length-feltet og indtast længden
         click_right_of(length_field)
-        time.sleep(0.2)
+        settle("length_field_focus", 0.2)
         pyautogui.hotkey("ctrl", "a")  # Vælg alt tekst
-        time.sleep(0.1)
-        pyautogui.write(length_time, interval=0.01)  # Skriv længden
+        settle("length_field_select", 0.1)
+        enter_text(length_time)  # Indsæt længden
 
         # Hvis det ikke er den første prøve, klik OK knappen
         if sample_number_in_sequence > 1:
-            ok_cancel_btn = pyautogui.locateOnScreen(ok_cancel_img, confidence=0.8)
+            ok_cancel_btn = locate(ok_cancel_img)
             if not ok_cancel_btn:
                 logging.error("Kunne ikke finde OK/cancel knappen")
                 raise RuntimeError(f"Kunne ikke finde OK/cancel knappen: {ok_cancel_img}")
 
-            time.sleep(0.2)
+            settle("sample_ok", 0.2)
             click_center_left(ok_cancel_btn)
-            time.sleep(2)
-
-        # Vent på at "behandler" vinduet lukker
-        wait_for_window_closed("processing")
+            # Vent til popup'en er lukket i stedet for en fast pause på 2 s
+            wait_for_state({ScreenState.ADD_SAMPLE_POPUP}, timeout=2, present=False, step="add_sample_popup_close")
+        step_done("range")
+
+        if wait_for_processing:
+            # Vent på at "behandler" vinduet lukker og analysevinduet falder til ro
+            wait_for_processing_done("processing_sample")
+        else:
+            # Genberegningen må køre videre, men der kan ikke skrives mens "processing"-vinduet er åbent
+            wait_for_window_closed("processing", hold_closed_seconds=0)
+        step_done("range_wait")
 
         # Find prøve-etiketten og indtast prøvens navn
-        try:
-            sample_tag = pyautogui.locateOnScreen("assets/images/color_label.png", confidence=0.8)
-            print("Prøve-etiket fundet")
-        except pyautogui.ImageNotFoundException:
-            logging.error("Kunne ikke finde prøve-etiketten")
-            print("Kunne ikke finde prøve-etiketten")
-            raise RuntimeError(f"Kunne ikke finde prøve-etiketten")
+        sample_tag = locate("assets/images/color_label.png")
 
         if not sample_tag:
             logging.error("Kunne ikke finde prøve-etiketten")
@@ -123,16 +138,19 @@ def add_sample(start_time: str, length_time: str, sample_number_in_sequence: int
             raise RuntimeError(f"Kunne ikke finde prøve-etiketten: {sample_tag}")
 
         # Klik på etiket-feltet og indtast prøvens navn
-        time.sleep(0.5)
+        settle("label_found", 0.5)
         click_right_of(sample_tag)
-        time.sleep(0.5)
+        settle("label_focus", 0.5)
         pyautogui.hotkey("ctrl", "a")  # Vælg alt tekst
-        time.sleep(0.5)
-        pyautogui.write(sample_name, interval=0.01)  # Skriv prøvens navn
-        time.sleep(0.5)
+        settle("label_select", 0.5)
+        enter_text(sample_name)  # Indsæt prøvens navn
+        settle("label_entered", 0.5)
+        step_done("label")
 
-        # Vent på at "behandler" vinduet lukker igen
-        wait_for_window_closed("processing")
+        if wait_for_processing:
+            # Vent på at "behandler" vinduet lukker og analysevinduet falder til ro igen
+            wait_for_processing_done("processing_sample")
+        step_done("label_wait")
 
         return True
     except Exception as e:
@@ -140,6 +158,32 @@ def add_sample(start_time: str, length_time: str, sample_number_in_sequence: int
         return False
 
 
+@tracing.traced("add_samples_batched")
+def add_samples_batched(samples: List[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    Indtaster alle blokkens samples uden at vente på genberegning mellem dem og
+    venter på "processing" én gang til sidst
+
+    Kubios redigerer label på det valgte sample, og et nyt sample er valgt lige efter
+    det er tilføjet, så label skrives i samme gennemløb som intervallet i stedet for i
+    en separat runde bagefter. Returnerer tiden brugt pr. trin
+    Rejser RuntimeError hvis et sample ikke kan tilføjes eller genberegningen ikke bliver
+    færdig, så blokken ikke gemmes og registreres som færdig med manglende samples
+    """
+    timings: Dict[str, float] = {}
+    for smp in samples:
+        logging.info(f"Tilføjer sample {smp['index']}: {smp['label']} ({smp['start_time']}, {smp['length']})")
+        if not add_sample(smp["start_time"], smp["length"], smp["index"], smp["label"],
+                          wait_for_processing=False, timings=timings):
+            raise RuntimeError(f"Sample {smp['index']} ({smp['label']}) kunne ikke tilføjes")
+    final_wait_start = time.monotonic()
+    finished = wait_for_processing_done("processing_batch")
+    timings["final_wait"] = time.monotonic() - final_wait_start
+    if not finished:
+        raise RuntimeError("Kubios blev ikke færdig med at genberegne blokkens samples")
+    return timings
+
+
 def debug_region(region, pause: float = 1):
     """
     Hjælpefunktion til at se hvilket område på skærmen der arbejdes med
@@ -162,6 +206,7 @@ def debug_region(region, pause: float = 1):
         return None
 
 
+@tracing.traced("save_results", filename="filename")
 def save_results(save_dir: str, filename: str, save_cancel_img: str = "assets/images/save_dialog_save_cancel.png",
                  save_dialog_dir_img: str = "assets/images/save_as_dir_box.png",
                  filename_img: str = "assets/images/save_dialog_filename.png"):
@@ -179,45 +224,47 @@ def save_results(save_dir: str, filename: str, save_cancel_img: str = "assets/im
         if detect_save_dialog():
             print("Gem-dialog fundet")
 
-        # Find feltet hvor mappen skal indtastes
-        path_field = pyautogui.locateOnScreen(save_dialog_dir_img, confidence=0.8)
-        time.sleep(0.5)
+        # Find mappe-feltet, filnavn-feltet og gem-knappen på samme skærmbillede
+        settle("save_dialog_open", 0.5)
+        fields = match_templates([save_dialog_dir_img, filename_img, save_cancel_img])
+        path_field = fields[save_dialog_dir_img][0] if fields[save_dialog_dir_img] else None
         if not path_field:
             raise RuntimeError(f"Kunne ikke finde mappe-feltet i gem-dialogen")
 
         # Klik på mappe-feltet og indtast mappen
         click_center_left(path_field)
-        time.sleep(0.2)
+        settle("save_dir_focus", 0.2)
         pyautogui.hotkey("ctrl", "a")  # Vælg alt tekst
-        time.sleep(0.2)
-        pyautogui.write(save_dir, interval=0.01)  # Skriv mappen
+        settle("save_dir_select", 0.2)
+        enter_text(save_dir)  # Indsæt mappen
         pyautogui.hotkey("enter")  # Tryk Enter
 
-        # Find feltet hvor filnavnet skal indtastes
-        filename_field = pyautogui.locateOnScreen(filename_img, confidence=0.8)
-        time.sleep(0.5)
+        # Filnavn-feltet blev som regel fundet sammen med mappe-feltet
+        filename_field = fields[filename_img][0] if fields[filename_img] else locate(filename_img)
+        settle("save_dir_entered", 0.5)
         if not filename_field:
             raise RuntimeError(f"Kunne ikke finde filnavn-feltet")
 
         # Klik på filnavn-feltet og indtast filnavnet
-        time.sleep(0.2)
+        settle("save_filename_found", 0.2)
         click_right_upper(filename_field)
-        time.sleep(0.2)
+        settle("save_filename_focus", 0.2)
         pyautogui.hotkey("ctrl", "a")  # Vælg alt tekst
-        time.sleep(0.2)
-        pyautogui.write(filename, interval=0.01)  # Skriv filnavnet
-        time.sleep(0.2)
+        settle("save_filename_select", 0.2)
+        enter_text(filename)  # Indsæt filnavnet
+        settle("save_filename_entered", 0.2)
 
-        # Find og klik på gem-knappen
-        save_cancel_btn = pyautogui.locateOnScreen(save_cancel_img, confidence=0.8)
+        # Klik på gem-knappen (søges igen hvis den ikke var synlig i første skærmbillede)
+        save_cancel_btn = fields[save_cancel_img][0] if fields[save_cancel_img] else locate(save_cancel_img)
         if not save_cancel_btn:
             raise RuntimeError(f"Kunne ikke finde gem/annuller knappen")
-        time.sleep(0.2)
+        settle("save_button_found", 0.2)
         click_center_left(save_cancel_btn)
-        time.sleep(0.2)
+        settle("save_button_clicked", 0.2)
 
-        # Vent på at "behandler" vinduet lukker
-        wait_for_window_closed("processing")
+        # Vent på at "behandler" vinduet lukker og analysevinduet falder til ro
+        if not wait_for_processing_done("processing_save"):
+            raise RuntimeError("Kubios blev ikke færdig med at gemme resultaterne")
         print("Resultater gemt")
         return True
     except Exception as e:
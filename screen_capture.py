@@ -0,0 +1,190 @@
+"""screen_capture.py
+Fælles skærm-capture til alle detektorer og OCR.
+
+Det seneste skærmbillede (gråtone) genbruges så længe det er yngre end ttl sekunder,
+og udsnit skæres direkte ud af det i stedet for at tage et nyt billede. Selve
+capture sker med GDI (BitBlt) gennem en device context og bitmaps på størrelse med
+udsnittet, der oprettes én gang pr. størrelse og genbruges; fejler det (eller mangler
+pywin32) bruges PIL's ImageGrab.
+
+Billedet skal invalideres når automatiseringen ændrer skærmen (klik, tastetryk),
+ellers kan en detektor få et billede fra før handlingen.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Tuple
+
+import cv2
+import numpy as np
+from PIL import ImageGrab
+
+from config import CAPTURE_TTL
+
+logger = logging.getLogger(__name__)
+
+BBox = Tuple[int, int, int, int]  # (left, top, right, bottom)
+
+
+class PilCapture:
+    """Fallback: nyt ImageGrab-billede for hvert kald"""
+    name = "pil"
+
+    def grab(self, bbox: BBox | None = None) -> np.ndarray:
+        return np.asarray(ImageGrab.grab(bbox=bbox).convert("L"))
+
+
+class GdiCapture:
+    """
+    BitBlt fra skrivebordet ind i en genbrugt bitmap på størrelse med udsnittet, så et
+    lille udsnit kun kopierer sine egne pixels og ikke hele skærmen
+    """
+    name = "gdi"
+    MAX_BITMAPS = 8  # Udsnits-størrelser der holdes på; detektorerne bruger de samme få igen og igen
+
+    def __init__(self):
+        import win32api
+        import win32con
+        import win32gui
+        import win32ui
+        self._win32gui = win32gui
+        self._win32ui = win32ui
+        self._srccopy = win32con.SRCCOPY
+        self.width = win32api.GetSystemMetrics(win32con.SM_CXSCREEN)
+        self.height = win32api.GetSystemMetrics(win32con.SM_CYSCREEN)
+        self._hwnd = win32gui.GetDesktopWindow()
+        self._window_dc = win32gui.GetWindowDC(self._hwnd)
+        self._src_dc = win32ui.CreateDCFromHandle(self._window_dc)
+        self._mem_dc = self._src_dc.CreateCompatibleDC()
+        self._bitmaps = {}  # (w, h) -> bitmap, ældste først
+        self._bitmap_for(self.width, self.height)
+
+    def _bitmap_for(self, w: int, h: int):
+        bitmap = self._bitmaps.pop((w, h), None)
+        if bitmap is None:
+            if len(self._bitmaps) >= self.MAX_BITMAPS:
+                oldest = next(iter(self._bitmaps))
+                self._win32gui.DeleteObject(self._bitmaps.pop(oldest).GetHandle())
+            bitmap = self._win32ui.CreateBitmap()
+            bitmap.CreateCompatibleBitmap(self._src_dc, w, h)
+        self._bitmaps[(w, h)] = bitmap  # Flyttes bagerst, så den senest brugte bliver længst
+        return bitmap
+
+    def grab(self, bbox: BBox | None = None) -> np.ndarray:
+        left, top, right, bottom = bbox or (0, 0, self.width, self.height)
+        left, top = max(left, 0), max(top, 0)
+        right, bottom = min(right, self.width), min(bottom, self.height)
+        w, h = max(right - left, 0), max(bottom - top, 0)
+        if not w or not h:
+            return np.zeros((h, w), dtype=np.uint8)
+        bitmap = self._bitmap_for(w, h)
+        self._mem_dc.SelectObject(bitmap)
+        self._mem_dc.BitBlt((0, 0), (w, h), self._src_dc, (left, top), self._srccopy)
+        # 32 bit pr. pixel, så rækkerne er w * 4 bytes uden udfyldning
+        bgra = np.frombuffer(bitmap.GetBitmapBits(True), dtype=np.uint8).reshape(h, w, 4)
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2GRAY)
+
+    def close(self) -> None:
+        try:
+            self._mem_dc.DeleteDC()
+            self._src_dc.DeleteDC()
+            self._win32gui.ReleaseDC(self._hwnd, self._window_dc)
+            for bitmap in self._bitmaps.values():
+                self._win32gui.DeleteObject(bitmap.GetHandle())
+            self._bitmaps = {}
+        except Exception as e:
+            logger.debug(f"Could not release GDI objects: {e}")
+
+
+def _default_backend():
+    try:
+        return GdiCapture()
+    except Exception as e:
+        logger.info(f"GDI capture not available, using ImageGrab: {e}")
+        return PilCapture()
+
+
+class FrameCache:
+    """Deler det seneste skærmbillede mellem alle detektorer i op til ttl sekunder"""
+
+    def __init__(self, backend=None, ttl: float = CAPTURE_TTL):
+        self._backend = backend
+        self.ttl = ttl
+        self._frame: np.ndarray | None = None
+        self._taken_at = None
+        self.captures = 0
+        self.served_from_cache = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = _default_backend()
+        return self._backend
+
+    def invalidate(self) -> None:
+        self._taken_at = None
+
+    def _capture(self, bbox: BBox | None = None) -> np.ndarray:
+        self.captures += 1
+        try:
+            return self.backend.grab(bbox)
+        except Exception as e:
+            if isinstance(self._backend, PilCapture):
+                raise
+            # Fx når skrivebordet er låst eller opløsningen ændret – fortsæt med ImageGrab
+            logger.warning(f"{self.backend.name} capture failed, falling back to ImageGrab: {e}")
+            self._backend = PilCapture()
+            return self._backend.grab(bbox)
+
+    def _fresh(self) -> bool:
+        return self._taken_at is not None and time.monotonic() - self._taken_at < self.ttl
+
+    def frame(self) -> np.ndarray:
+        """Hele skærmen i gråtone; genbruges hvis det seneste billede er friskt nok"""
+        if self._fresh():
+            self.served_from_cache += 1
+            return self._frame
+        self._frame = self._capture()
+        self._taken_at = time.monotonic()
+        return self._frame
+
+    def crop(self, bbox: BBox) -> np.ndarray:
+        """
+        Udsnit (left, top, right, bottom) af skærmen. Skæres ud af det seneste billede hvis
+        det er friskt, ellers tages kun udsnittet (som ikke gemmes til andre)
+        """
+        if self._fresh():
+            self.served_from_cache += 1
+            left, top, right, bottom = bbox
+            return self._frame[max(top, 0):bottom, max(left, 0):right]
+        return self._capture(bbox)
+
+
+_frame_cache = FrameCache()
+
+
+def get_frame_cache() -> FrameCache:
+    """Den fælles capture-cache som screen_match, detektorer og OCR bruger"""
+    return _frame_cache
+
+
+def invalidate_frame() -> None:
+    """Kaldes efter klik og tastetryk, så næste detektor ser skærmen efter handlingen"""
+    _frame_cache.invalidate()
+
+
+# Test område
+if __name__ == "__main__":
+    cache = get_frame_cache()
+    t0 = time.perf_counter()
+    for _ in range(20):
+        cache.invalidate()
+        cache.frame()
+    print(f"{cache.backend.name}: {(time.perf_counter() - t0) / 20 * 1000:.1f} ms pr. fuldt skærmbillede")
+    t0 = time.perf_counter()
+    for _ in range(20):
+        cache.invalidate()
+        cache.crop((0, 0, 200, 100))
+    print(f"{cache.backend.name}: {(time.perf_counter() - t0) / 20 * 1000:.1f} ms pr. udsnit 200x100")
@@ -0,0 +1,260 @@
+"""screen_match.py
+Finder flere skabeloner (knapper, felter, labels) på ét skærmbillede.
+
+pyautogui.locateOnScreen tager et nyt skærmbillede for hver skabelon og indlæser
+skabelonen fra disk hver gang. Her indlæses alle billeder fra assets/images én gang
+som gråtone-arrays, der tages ét skærmbillede, og alle skabeloner matches mod
+det samme billede med cv2.matchTemplate.
+
+Kubios' dialoger ligger samme sted gennem en session, så når en skabelon først er
+fundet, søges der næste gang kun i et lille område (ROI) omkring det sidste hit.
+Rammer ROI-søgningen forbi, glemmes ankeret og der søges på hele skærmen igen.
+Ankrene nulstilles når Kubios genstartes (se KubiosSession).
+
+Kør som script for en micro-benchmark mod gemte skærmbilleder:
+    python screen_match.py <mappe med skærmbilleder>
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import cv2
+import numpy as np
+
+from screen_capture import get_frame_cache
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = Path("assets/images")
+DEFAULT_CONFIDENCE = 0.8
+ANCHOR_PADDING = 48  # Pixels omkring sidste hit der søges i
+
+# Samme felter som pyscreeze.Box, så pyautogui.center og click_*-hjælperne virker uændret
+Box = namedtuple("Box", "left top width height")
+
+_templates: Dict[str, np.ndarray] = {}
+
+
+class AnchorCache:
+    """Sidste kendte position for hver skabelon i den aktuelle Kubios-session"""
+
+    def __init__(self, padding: int = ANCHOR_PADDING):
+        self.padding = padding
+        self.boxes: Dict[str, Box] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def roi(self, key: str) -> Tuple[int, int, int, int] | None:
+        """(left, top, right, bottom) på skærmen omkring sidste hit, eller None"""
+        box = self.boxes.get(key)
+        if box is None:
+            return None
+        p = self.padding
+        return (max(box.left - p, 0), max(box.top - p, 0),
+                box.left + box.width + p, box.top + box.height + p)
+
+    def update(self, key: str, box: Box) -> None:
+        self.boxes[key] = box
+
+    def invalidate(self, key: str) -> None:
+        self.boxes.pop(key, None)
+        self.misses += 1
+
+    def clear(self) -> None:
+        self.boxes.clear()
+
+
+_anchors = AnchorCache()
+
+
+def get_anchor_cache() -> AnchorCache:
+    return _anchors
+
+
+def reset_anchors() -> None:
+    """Glemmer alle ankre, fx når Kubios genstartes og vinduerne kan ligge andre steder"""
+    _anchors.clear()
+
+
+def _key(path) -> str:
+    # Filnavne sammenlignes uden hensyn til store/små bogstaver (assets hedder fx .PNG)
+    return Path(path).name.lower()
+
+
+def load_templates(directory=TEMPLATE_DIR) -> int:
+    """Indlæser alle billeder i mappen som gråtone-arrays. Returnerer antal skabeloner"""
+    for path in Path(directory).iterdir():
+        if path.suffix.lower() in (".png", ".jpg", ".bmp"):
+            img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                logger.warning(f"Could not load template {path}")
+                continue
+            _templates[_key(path)] = img
+    return len(_templates)
+
+
+def get_template(path) -> np.ndarray:
+    """Skabelon fra cachen; indlæses fra disk hvis den ikke er forudindlæst"""
+    key = _key(path)
+    tpl = _templates.get(key)
+    if tpl is None:
+        tpl = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if tpl is None:
+            raise FileNotFoundError(f"Template not found: {path}")
+        _templates[key] = tpl
+    return tpl
+
+
+def grab_frame(bbox: Tuple[int, int, int, int] | None = None) -> np.ndarray:
+    """
+    Gråtone-skærmbillede af den primære skærm (samme koordinater som pyautogui), evt. kun bbox
+    Kommer fra den fælles capture-cache, så flere søgninger lige efter hinanden deler billedet
+    """
+    cache = get_frame_cache()
+    return cache.crop(bbox) if bbox else cache.frame()
+
+
+def _union(rois) -> Tuple[int, int, int, int]:
+    return (min(r[0] for r in rois), min(r[1] for r in rois),
+            max(r[2] for r in rois), max(r[3] for r in rois))
+
+
+def _hits(result: np.ndarray, w: int, h: int, confidence: float, find_all: bool,
+          offset: Tuple[int, int] = (0, 0)) -> List[Tuple[float, Box]]:
+    """Omsætter et matchTemplate-resultat til Box'e (bedste først)"""
+    ox, oy = offset
+    if not find_all:
+        _, max_val, _, (x, y) = cv2.minMaxLoc(result)
+        return [(max_val, Box(x + ox, y + oy, w, h))] if max_val >= confidence else []
+
+    ys, xs = np.nonzero(result >= confidence)
+    if xs.size == 0:
+        return []
+    scores = result[ys, xs]
+    order = np.argsort(-scores)
+    hits: List[Tuple[float, Box]] = []
+    # Simpel non-maximum suppression: et hit inden for en skabelon-størrelse af et bedre hit droppes
+    for i in order:
+        x, y = int(xs[i]), int(ys[i])
+        if all(abs(x + ox - b.left) >= w or abs(y + oy - b.top) >= h for _, b in hits):
+            hits.append((float(scores[i]), Box(x + ox, y + oy, w, h)))
+    return hits
+
+
+def match_templates(paths: Iterable, frame: np.ndarray | None = None,
+                    confidence: float = DEFAULT_CONFIDENCE, find_all: bool = False,
+                    use_anchors: bool = True) -> Dict[str, List[Box]]:
+    """
+    Matcher alle skabeloner mod ét skærmbillede
+    Returnerer {sti: [Box, ...]} – tom liste hvis skabelonen ikke blev fundet.
+    Uden find_all returneres kun det bedste hit pr. skabelon, og kendte ankre
+    søges først i deres ROI. Et givet frame skal dække hele skærmen
+    """
+    paths = list(paths)
+    use_anchors = use_anchors and not find_all
+    origin = (0, 0)
+    partial = False
+    if frame is None:
+        rois = [_anchors.roi(_key(p)) for p in paths] if use_anchors else [None]
+        if all(rois):
+            # Alle skabeloner har et anker: tag kun et billede af området omkring dem
+            bbox = _union(rois)
+            frame = grab_frame(bbox)
+            origin = bbox[:2]
+            partial = True
+        else:
+            frame = grab_frame()
+
+    found: Dict[str, List[Box]] = {}
+    for path in paths:
+        key = _key(path)
+        tpl = get_template(path)
+        h, w = tpl.shape[:2]
+
+        roi = _anchors.roi(key) if use_anchors else None
+        if roi is not None:
+            left, top = roi[0] - origin[0], roi[1] - origin[1]
+            crop = frame[max(top, 0):roi[3] - origin[1], max(left, 0):roi[2] - origin[0]]
+            if crop.shape[0] >= h and crop.shape[1] >= w:
+                result = cv2.matchTemplate(crop, tpl, cv2.TM_CCOEFF_NORMED)
+                hits = _hits(result, w, h, confidence, False,
+                             (max(left, 0) + origin[0], max(top, 0) + origin[1]))
+                if hits:
+                    _anchors.hits += 1
+                    found[path] = [hits[0][1]]
+                    continue
+            # Forbier i ROI: glem ankeret og søg på hele skærmen
+            _anchors.invalidate(key)
+            if partial:
+                # Billedet dækker kun ankrene – tag et af hele skærmen til resten
+                frame = grab_frame()
+                origin = (0, 0)
+                partial = False
+
+        if h > frame.shape[0] or w > frame.shape[1]:
+            found[path] = []
+            continue
+        result = cv2.matchTemplate(frame, tpl, cv2.TM_CCOEFF_NORMED)
+        found[path] = [box for _, box in _hits(result, w, h, confidence, find_all, origin)]
+        if use_anchors and found[path]:
+            _anchors.update(key, found[path][0])
+    return found
+
+
+def locate(path, frame: np.ndarray | None = None, confidence: float = DEFAULT_CONFIDENCE) -> Box | None:
+    """Som pyautogui.locateOnScreen, men returnerer None i stedet for at rejse en undtagelse"""
+    boxes = match_templates([path], frame, confidence)[path]
+    return boxes[0] if boxes else None
+
+
+def locate_any(paths: Iterable, frame: np.ndarray | None = None,
+               confidence: float = DEFAULT_CONFIDENCE) -> Tuple[str, Box] | Tuple[None, None]:
+    """Første skabelon (i den givne rækkefølge) der findes på skærmbilledet"""
+    paths = list(paths)
+    found = match_templates(paths, frame, confidence)
+    for path in paths:
+        if found[path]:
+            return path, found[path][0]
+    return None, None
+
+
+def _benchmark(screenshot_dir: Path, repeats: int = 5) -> None:
+    """Sammenligner match_templates med pyautogui.locate pr. skabelon på gemte skærmbilleder"""
+    import pyautogui
+    from PIL import Image
+
+    load_templates()
+    template_paths = [str(p) for p in TEMPLATE_DIR.iterdir() if _key(p) in _templates]
+    shots = sorted(p for p in screenshot_dir.iterdir() if p.suffix.lower() in (".png", ".jpg", ".bmp"))
+    print(f"{len(template_paths)} skabeloner, {len(shots)} skærmbilleder, {repeats} gentagelser")
+    for shot in shots:
+        image = Image.open(shot)
+        frame = np.asarray(image.convert("L"))
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            ours = match_templates(template_paths, frame)
+        ours_ms = (time.perf_counter() - t0) / repeats * 1000
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            for path in template_paths:
+                try:
+                    pyautogui.locate(path, image, confidence=DEFAULT_CONFIDENCE)
+                except pyautogui.ImageNotFoundException:
+                    pass
+        theirs_ms = (time.perf_counter() - t0) / repeats * 1000
+
+        hits = sum(1 for boxes in ours.values() if boxes)
+        print(f"{shot.name}: match_templates {ours_ms:.1f} ms, pyautogui.locate {theirs_ms:.1f} ms "
+              f"({theirs_ms / ours_ms:.1f}x), {hits} skabeloner fundet")
+
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(Path(sys.argv[1]) if len(sys.argv) > 1 else TEMPLATE_DIR)
@@ -0,0 +1,133 @@
+"""screen_state.py
+Genkender hvilken tilstand Kubios' brugerflade er i ud fra ét skærmbillede.
+
+Alle kendte tilstande (åbn datafil, analysevindue, tilføj sample, gem-dialog,
+fejl og behandler) klassificeres i én runde: ét skærmbillede matches mod alle
+kendetegnende skabeloner, og fejl-/behandler-vinduer findes på titlen i det fælles
+vindues-øjebliksbillede. Pipelinen venter så på en tilstand med wait_for_state
+og reagerer inden for ét poll-interval i stedet for efter faste pauser.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Dict, FrozenSet, Iterable, List
+
+from config import STATE_POLL_INTERVAL
+from screen_match import Box, grab_frame, match_templates
+from window_snapshot import get_snapshot
+from timing_model import get_timing_model
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class ScreenState(str, Enum):
+    UNKNOWN = "unknown"
+    OPEN_DATA_DIALOG = "open_data_dialog"
+    ANALYSIS_WINDOW = "analysis_window"
+    ADD_SAMPLE_POPUP = "add_sample_popup"
+    SAVE_DIALOG = "save_dialog"
+    ERROR = "error"
+    PROCESSING = "processing"
+
+
+# Skabeloner der kendetegner en tilstand (én er nok)
+STATE_TEMPLATES: Dict[ScreenState, List[str]] = {
+    ScreenState.OPEN_DATA_DIALOG: ["assets/images/read_data_file.png"],
+    ScreenState.ANALYSIS_WINDOW: ["assets/images/analysis_window.png"],
+    ScreenState.ADD_SAMPLE_POPUP: ["assets/images/add_sample_popup_start.png"],
+    ScreenState.SAVE_DIALOG: ["assets/images/save_cancel.png"],
+}
+
+# Tilstande der genkendes på vinduestitlen (som detect_analysis_error og wait_for_window_closed)
+STATE_TITLES: Dict[ScreenState, str] = {
+    ScreenState.ERROR: "error",
+    ScreenState.PROCESSING: "processing",
+}
+
+# Dialoger ligger oven på analysevinduet, så de vinder når flere er synlige
+STATE_PRIORITY = [
+    ScreenState.ERROR,
+    ScreenState.PROCESSING,
+    ScreenState.SAVE_DIALOG,
+    ScreenState.OPEN_DATA_DIALOG,
+    ScreenState.ADD_SAMPLE_POPUP,
+    ScreenState.ANALYSIS_WINDOW,
+]
+
+
+@dataclass(frozen=True)
+class Observation:
+    """Resultatet af én klassifikation"""
+    state: ScreenState                  # Den øverste synlige tilstand
+    visible: FrozenSet[ScreenState]     # Alle tilstande der blev genkendt
+    boxes: Dict[str, List[Box]]         # Skabelon-hits, så kalderen kan klikke uden ny søgning
+
+
+def classify(frame=None) -> Observation:
+    """Klassificerer skærmen i én runde: ét skærmbillede og ét vindues-øjebliksbillede"""
+    if frame is None:
+        frame = grab_frame()
+    paths = [path for state_paths in STATE_TEMPLATES.values() for path in state_paths]
+    boxes = match_templates(paths, frame)
+
+    visible = {state for state, state_paths in STATE_TEMPLATES.items()
+               if any(boxes[path] for path in state_paths)}
+    snapshot = get_snapshot()
+    for state, title in STATE_TITLES.items():
+        if snapshot.find(title):
+            visible.add(state)
+
+    state = next((s for s in STATE_PRIORITY if s in visible), ScreenState.UNKNOWN)
+    return Observation(state, frozenset(visible), boxes)
+
+
+def wait_for_state(targets: Iterable[ScreenState], timeout: float,
+                   poll_interval: float = STATE_POLL_INTERVAL,
+                   on_error: Callable[[Observation], None] | None = None,
+                   present: bool = True, step: str | None = None) -> Observation | None:
+    """
+    Venter til en af targets er synlig (eller med present=False: ingen af dem er synlige)
+    og returnerer observationen, eller None ved timeout
+    Vises en fejl-dialog undervejs (og ERROR ikke er et mål), kaldes on_error så den kan lukkes
+    Med step sættes timeout ud fra timing-modellen (timeout er så standardværdien),
+    og ventetiden registreres under det navn
+    """
+    targets = frozenset(targets)
+    model = get_timing_model()
+    if step:
+        timeout = model.timeout(step, timeout)
+    started = time.monotonic()
+    deadline = started + timeout
+    polls = 0
+    while True:
+        polls += 1
+        observation = classify()
+        if ScreenState.ERROR in observation.visible and ScreenState.ERROR not in targets and on_error:
+            on_error(observation)
+            get_snapshot().invalidate()
+        elif bool(observation.visible & targets) == present:
+            logger.debug(f"Tilstand {observation.state.value} genkendt efter {polls} poll")
+            if step:
+                model.record(step, time.monotonic() - started)
+            return observation
+        if time.monotonic() >= deadline:
+            logger.warning(f"Timeout efter {timeout:.0f}s: {'ingen af' if present else 'stadig synlig:'} "
+                           f"{sorted(t.value for t in targets)} (sidst set: {observation.state.value})")
+            if step:
+                # Registreres med timeouten, så en for stram model retter sig selv op
+                model.record(step, timeout)
+            return None
+        tracing.sleep(poll_interval)
+
+
+# Test område
+if __name__ == "__main__":
+    while True:
+        obs = classify()
+        print(obs.state.value, sorted(s.value for s in obs.visible))
+        time.sleep(1)
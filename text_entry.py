@@ -0,0 +1,124 @@
+"""text_entry.py
+Indtastning af stier, tider, labels og filnavne via udklipsholderen.
+
+I stedet for at skrive ét tegn ad gangen med pyautogui.write indsættes hele
+værdien med ctrl+v, og brugerens udklipsholder gendannes bagefter. Med verify
+læses feltet tilbage (ctrl+a, ctrl+c) og sammenlignes; kun hvis det ikke passer,
+skrives værdien igen tast for tast som før, og passer den stadig ikke, rejses
+TextEntryError, så en forkert sti eller tid aldrig sendes videre til Kubios.
+Indeholder udklipsholderen andet end tekst (fx et billede), røres den ikke bagefter.
+
+Benchmark mod tast-for-tast (placér markøren i et tomt tekstfelt, fx Notesblok):
+    python text_entry.py
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+
+import pyautogui
+import pyperclip
+import win32clipboard
+
+from config import TEXT_ENTRY_VERIFY
+import tracing
+
+logger = logging.getLogger(__name__)
+
+PASTE_SETTLE = 0.05  # Sekunder programmet får til at læse udklipsholderen efter ctrl+v/ctrl+c
+
+
+class TextEntryError(RuntimeError):
+    """Feltet indeholder ikke den tekst der blev indtastet"""
+
+
+class TextEntryStats:
+    def __init__(self):
+        self.pasted = 0
+        self.verified = 0
+        self.fallbacks = 0
+
+
+stats = TextEntryStats()
+
+
+def _read_field() -> str:
+    # Markerer hele feltet og kopierer det; markeringen bevares, så næste indtastning erstatter den
+    pyperclip.copy("")
+    pyautogui.hotkey("ctrl", "a")
+    pyautogui.hotkey("ctrl", "c")
+    tracing.sleep(PASTE_SETTLE)
+    return pyperclip.paste()
+
+
+def _saved_clipboard() -> str | None:
+    # Brugerens tekst i udklipsholderen, eller None hvis den er tom eller indeholder andet end tekst
+    if not win32clipboard.IsClipboardFormatAvailable(win32clipboard.CF_UNICODETEXT):
+        return None
+    return pyperclip.paste()
+
+
+def enter_text(text: str, verify: bool = TEXT_ENTRY_VERIFY, fallback_interval: float = 0.01) -> None:
+    """
+    Indsætter text i feltet med fokus (eventuel markering erstattes)
+    Rejser TextEntryError hvis feltet heller ikke indeholder text efter tast-for-tast-indtastning
+    """
+    text = str(text)
+    try:
+        saved_clipboard = _saved_clipboard()
+    except (pyperclip.PyperclipException, win32clipboard.error) as e:
+        logger.warning(f"Clipboard not available, typing instead: {e}")
+        pyautogui.write(text, interval=fallback_interval)
+        stats.fallbacks += 1
+        return
+
+    try:
+        pyperclip.copy(text)
+        pyautogui.hotkey("ctrl", "v")
+        tracing.sleep(PASTE_SETTLE)
+        stats.pasted += 1
+        if not verify:
+            return
+
+        if _read_field().strip() == text.strip():
+            stats.verified += 1
+            return
+
+        logger.warning(f"Read-back did not match '{text}', typing it instead")
+        stats.fallbacks += 1
+        pyautogui.hotkey("ctrl", "a")
+        pyautogui.write(text, interval=fallback_interval)
+        typed = _read_field().strip()
+        if typed != text.strip():
+            raise TextEntryError(f"Field contains '{typed}' after typing '{text}'")
+    finally:
+        if saved_clipboard is not None:
+            try:
+                pyperclip.copy(saved_clipboard)
+            except pyperclip.PyperclipException as e:
+                logger.warning(f"Could not restore clipboard: {e}")
+
+
+def _benchmark(values=None, interval: float = 0.01, repeats: int = 3) -> None:
+    """Sammenligner enter_text (med og uden read-back) med pyautogui.write i feltet med fokus"""
+    values = values or [r"\\server\share\kohorte\patient_0042\optagelse_2024-02-01.edf",
+                        "07:53:59", "02:00:00", "dag 1 08-12", "patient_0042_1_of_3"]
+    print("Placér markøren i et tomt tekstfelt – starter om 5 sekunder")
+    time.sleep(5)
+    for value in values:
+        results = {}
+        for name, action in (("write", lambda: pyautogui.write(value, interval=interval)),
+                             ("paste", lambda: enter_text(value, verify=False)),
+                             ("paste+verify", lambda: enter_text(value, verify=True))):
+            t0 = time.perf_counter()
+            for _ in range(repeats):
+                pyautogui.hotkey("ctrl", "a")
+                action()
+            results[name] = (time.perf_counter() - t0) / repeats * 1000
+        print(f"{len(value):3} tegn: " + ", ".join(f"{k} {v:.0f} ms" for k, v in results.items()))
+    print(f"Indsat {stats.pasted}, verificeret {stats.verified}, tast-for-tast {stats.fallbacks}")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,115 @@
+"""timing_model.py
+Lærte ventetider for hvert navngivet trin i Kubios-automatiseringen.
+
+Hver gang et trin (fx "save_dialog" eller "processing") er færdigt, gemmes hvor
+lang tid det tog. Timeouts sættes derefter til p99 af de seneste målinger gange
+en faktor plus en fast margin, så en hurtig maskine ikke venter som den
+langsomste, og en langsom maskine ikke løber tør for tid. Indtil der er nok
+målinger bruges den faste standardværdi. Målingerne gemmes i TIMING_MODEL_FILE
+mellem kørsler.
+
+Et trin der løber ud i timeout registreres med sin timeout, så modellen selv
+retter sig op hvis den er blevet for stram.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict
+
+from config import (TIMING_MODEL_FILE, TIMING_WINDOW, TIMING_MIN_SAMPLES,
+                    TIMEOUT_MARGIN_FACTOR, TIMEOUT_MARGIN_SECONDS, TIMEOUT_MAX_FACTOR)
+
+logger = logging.getLogger(__name__)
+
+TIMING_MODEL_VERSION = 1
+SAVE_EVERY = 25  # Gem efter så mange nye målinger, så et nedbrud ikke mister dem alle
+SPAN_STEP_PREFIX = "span_"  # Varigheder af hele trin fra tracing, fx "span_save_results"
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentil (q mellem 0 og 100)"""
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class TimingModel:
+    """De seneste målinger pr. trin og timeouts beregnet ud fra dem"""
+
+    def __init__(self, path=TIMING_MODEL_FILE, window: int = TIMING_WINDOW,
+                 min_samples: int = TIMING_MIN_SAMPLES):
+        self.path = Path(path)
+        self.window = window
+        self.min_samples = min_samples
+        self.samples: Dict[str, Deque[float]] = {}
+        self._unsaved = 0
+        self.load()
+
+    def load(self) -> None:
+        self.samples = {}
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not read timing model '{self.path}': {e}")
+            return
+        if data.get("version") != TIMING_MODEL_VERSION:
+            return
+        for step, values in data.get("steps", {}).items():
+            self.samples[step] = deque((float(v) for v in values), maxlen=self.window)
+
+    def save(self) -> None:
+        """Gemmer atomisk, så en afbrudt kørsel ikke efterlader en halv fil"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        steps = {step: [round(v, 3) for v in values] for step, values in self.samples.items()}
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": TIMING_MODEL_VERSION, "steps": steps}, f)
+            os.replace(tmp_path, self.path)
+            self._unsaved = 0
+        except OSError as e:
+            logger.warning(f"Could not save timing model '{self.path}': {e}")
+
+    def record(self, step: str, seconds: float) -> None:
+        self.samples.setdefault(step, deque(maxlen=self.window)).append(float(seconds))
+        self._unsaved += 1
+        if self._unsaved >= SAVE_EVERY:
+            self.save()
+
+    def timeout(self, step: str, default: float, minimum: float = 1.0) -> float:
+        """
+        p99 * faktor + margin når der er nok målinger, ellers default
+        Loftet (default * TIMEOUT_MAX_FACTOR) forhindrer at gentagne timeouts vokser uden grænse
+        """
+        values = self.samples.get(step)
+        if not values or len(values) < self.min_samples:
+            return default
+        learned = percentile(values, 99) * TIMEOUT_MARGIN_FACTOR + TIMEOUT_MARGIN_SECONDS
+        return min(max(learned, minimum), default * TIMEOUT_MAX_FACTOR)
+
+    def percentile(self, step: str, q: float) -> float | None:
+        """Percentil q af trinnets målinger, eller None indtil der er min_samples målinger"""
+        values = self.samples.get(step)
+        if not values or len(values) < self.min_samples:
+            return None
+        return percentile(values, q)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {step: {"n": len(values), "p50": percentile(values, 50), "p99": percentile(values, 99)}
+                for step, values in self.samples.items() if values}
+
+
+_model = TimingModel()
+
+
+def get_timing_model() -> TimingModel:
+    """Den fælles timing-model som alle ventetider bruger"""
+    return _model
@@ -0,0 +1,254 @@
+"""tracing.py
+Strukturerede spans for hvert trin i pipelinen.
+
+Et span måler ét trin (open_kubios, open_edf_file, ocr, perform_read, add_sample,
+save_results, restart osv.) og kan indeholde andre spans. Patient-ID, blok og
+sample arves fra det omsluttende span via contextvars, så et add_sample-span
+altid ved hvilken optagelse og blok det hører til.
+
+Afsluttede spans skrives som én JSON-linje i TRACE_FILE gennem en QueueHandler,
+så selve skrivningen sker i en baggrundstråd og ikke forsinker automatiseringen.
+Søvn (pauser og poll-intervaller) måles med tracing.sleep, så sammenfatningen
+efter kørslen kan vise hvor stor en del af tiden der blev sovet, samt
+p50/p95/max pr. trin. Varigheden af de trin planner.py regner med (STEP_COST_SPANS)
+gemmes også i timing-modellen.
+"""
+
+from __future__ import annotations
+
+import atexit
+import functools
+import inspect
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List
+
+from config import TRACE_FILE, STEP_COST_SPANS
+from timing_model import SPAN_STEP_PREFIX, get_timing_model, percentile
+
+logger = logging.getLogger(__name__)
+
+# Spans går til deres egen logger, så de ikke blandes med tekst-loggen
+_trace_logger = logging.getLogger("kubios.trace")
+_trace_logger.propagate = False
+_trace_logger.setLevel(logging.INFO)
+
+_current: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_ids = itertools.count(1)
+_cost_spans = frozenset(STEP_COST_SPANS.values())
+
+
+class Span:
+    def __init__(self, name: str, parent: "Span | None", attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = next(_ids)
+        self.parent = parent
+        # Attributter arves fra forælderen, så fx patient_id følger med ned til hvert sample
+        self.attributes = {**(parent.attributes if parent else {}), **attributes}
+        self.start_wall = datetime.now()
+        self.start = time.monotonic()
+        self.duration = None
+        self.sleep_seconds = 0.0
+        self.status = "ok"
+        self.error = None
+        self._token = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def fail(self, error=None) -> None:
+        """Markerer spannet som fejlet (til fejl der fanges i stedet for at blive rejst)"""
+        self.status = "failed"
+        if error is not None:
+            self.error = str(error)
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = {
+            "type": "span",
+            "run_id": _tracer.run_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start_wall.isoformat(timespec="milliseconds"),
+            "duration_s": round(self.duration, 4),
+            "sleep_s": round(self.sleep_seconds, 4),
+            "status": self.status,
+            **self.attributes,
+        }
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class _Tracer:
+    """Kørslens tilstand: varigheder pr. trin, samlet søvn og kø-listeneren"""
+
+    def __init__(self):
+        self.run_id = None
+        self.started = None
+        self.durations: Dict[str, List[float]] = {}
+        self.sleep_seconds = 0.0
+        self.listener: logging.handlers.QueueListener | None = None
+        self.handler: logging.handlers.QueueHandler | None = None
+
+    def reset(self) -> None:
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.monotonic()
+        self.durations = {}
+        self.sleep_seconds = 0.0
+
+
+_tracer = _Tracer()
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.trace, ensure_ascii=False, default=str)
+
+
+def start_tracing(path=TRACE_FILE) -> str:
+    """Starter en ny kørsel og skriver spans til path i en baggrundstråd. Returnerer run_id"""
+    stop_tracing()
+    _tracer.reset()
+    trace_queue = queue.SimpleQueue()
+    file_handler = logging.FileHandler(path, encoding="utf-8")
+    file_handler.setFormatter(_JsonFormatter())
+    _tracer.handler = logging.handlers.QueueHandler(trace_queue)
+    _tracer.listener = logging.handlers.QueueListener(trace_queue, file_handler)
+    _trace_logger.addHandler(_tracer.handler)
+    _tracer.listener.start()
+    return _tracer.run_id
+
+
+def stop_tracing() -> None:
+    """Tømmer køen og lukker trace-filen"""
+    if _tracer.listener is None:
+        return
+    _tracer.listener.stop()
+    for handler in _tracer.listener.handlers:
+        handler.close()
+    _trace_logger.removeHandler(_tracer.handler)
+    _tracer.listener = None
+    _tracer.handler = None
+
+
+atexit.register(stop_tracing)
+
+
+def _emit(record: Dict[str, Any]) -> None:
+    _trace_logger.info(record.get("name", record["type"]), extra={"trace": record})
+
+
+def start_span(name: str, **attributes) -> Span:
+    """
+    Starter et span under det aktuelle span og gør det til det aktuelle
+    Skal afsluttes med end_span (typisk i en finally-blok); ellers brug span()
+    """
+    current = Span(name, _current.get(), attributes)
+    current._token = _current.set(current)
+    return current
+
+
+def end_span(current: Span) -> None:
+    """Afslutter et span fra start_span, skriver det og gør forælderen aktuel igen"""
+    _current.reset(current._token)
+    current.duration = time.monotonic() - current.start
+    if current.parent is not None:
+        current.parent.sleep_seconds += current.sleep_seconds
+    _tracer.durations.setdefault(current.name, []).append(current.duration)
+    if current.name in _cost_spans and current.status == "ok":
+        # Gemmes mellem kørsler, så planner.py kan anslå tiden ud fra målte trin
+        get_timing_model().record(SPAN_STEP_PREFIX + current.name, current.duration)
+    _emit(current.to_dict())
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Måler with-blokken som et span under det aktuelle span"""
+    current = start_span(name, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        end_span(current)
+
+
+def traced(name: str | None = None, **arg_attributes):
+    """
+    Dekorator der kører funktionen i et span
+    arg_attributes knytter span-attributter til funktionens argumenter,
+    fx @traced("add_sample", sample="sample_number_in_sequence").
+    Returnerer funktionen False, markeres spannet som fejlet
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            attributes = {}
+            if arg_attributes:
+                bound = signature.bind_partial(*args, **kwargs).arguments
+                attributes = {attr: bound.get(param) for attr, param in arg_attributes.items()}
+            with span(name or fn.__name__, **attributes) as current:
+                result = fn(*args, **kwargs)
+                if result is False:
+                    current.fail()
+                return result
+        return wrapper
+    return decorator
+
+
+def sleep(seconds: float) -> None:
+    """time.sleep der tælles med i det aktuelle span og i kørslens samlede søvn"""
+    start = time.monotonic()
+    time.sleep(seconds)
+    slept = time.monotonic() - start
+    _tracer.sleep_seconds += slept
+    current = _current.get()
+    if current is not None:
+        current.sleep_seconds += slept
+
+
+def summary() -> Dict[str, Any]:
+    """p50/p95/max pr. trin og andelen af kørslens tid der blev sovet"""
+    wall = time.monotonic() - _tracer.started if _tracer.started is not None else 0.0
+    stages = {
+        name: {
+            "count": len(values),
+            "p50_s": round(percentile(values, 50), 3),
+            "p95_s": round(percentile(values, 95), 3),
+            "max_s": round(max(values), 3),
+            "total_s": round(sum(values), 3),
+        }
+        for name, values in sorted(_tracer.durations.items())
+    }
+    return {
+        "type": "summary",
+        "run_id": _tracer.run_id,
+        "wall_s": round(wall, 3),
+        "sleep_s": round(_tracer.sleep_seconds, 3),
+        "sleep_share": round(_tracer.sleep_seconds / wall, 4) if wall else 0.0,
+        "stages": stages,
+    }
+
+
+def log_summary() -> Dict[str, Any]:
+    """Skriver sammenfatningen til tekst-loggen og som sidste linje i trace-filen"""
+    result = summary()
+    logger.info(f"Trace {result['run_id']}: {result['wall_s']:.0f}s i alt, "
+                f"{result['sleep_s']:.0f}s sovet ({result['sleep_share']:.0%})")
+    for name, stats in result["stages"].items():
+        logger.info(f"  {name}: n={stats['count']}, p50={stats['p50_s']:.2f}s, "
+                    f"p95={stats['p95_s']:.2f}s, max={stats['max_s']:.2f}s")
+    _emit(result)
+    return result
@@ -0,0 +1,75 @@
+"""window_snapshot.py
+Fælles øjebliksbillede af Kubios' vinduer til alle detektorer.
+
+Vinduerne hentes med én UIA-enumeration filtreret på Kubios' PID og genbruges
+indtil billedet er ældre end ttl sekunder. Uanset hvor mange detektorer der spørger
+i samme polling-runde, koster det kun én enumeration.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, List
+
+from pywinauto import Desktop
+
+from kubios_control import get_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 0.5
+
+
+@dataclass(frozen=True)
+class WindowInfo:
+    handle: int
+    title: str
+    wrapper: Any  # pywinauto UIAWrapper
+
+
+class WindowSnapshot:
+    """Cacher Kubios' topniveau-vinduer i op til ttl sekunder"""
+
+    def __init__(self, session=None, ttl: float = DEFAULT_TTL):
+        self.session = session or get_session()
+        self.ttl = ttl
+        self._windows: List[WindowInfo] = []
+        self._taken_at = None
+        self.enumerations = 0
+        self.served_from_cache = 0
+
+    def invalidate(self) -> None:
+        self._taken_at = None
+
+    def windows(self) -> List[WindowInfo]:
+        now = time.monotonic()
+        if self._taken_at is not None and now - self._taken_at < self.ttl:
+            self.served_from_cache += 1
+            return self._windows
+
+        pid = self.session.pid
+        windows = []
+        if pid:
+            self.enumerations += 1
+            for win in Desktop(backend="uia").windows(process=pid):
+                try:
+                    windows.append(WindowInfo(win.handle, win.window_text(), win))
+                except Exception as e:
+                    # Vinduet kan være lukket mellem enumeration og opslag
+                    logger.debug(f"Skipping window during snapshot: {e}")
+        self._windows = windows
+        self._taken_at = time.monotonic()
+        return windows
+
+    def find(self, title_substring: str) -> List[WindowInfo]:
+        """Vinduer hvis titel indeholder title_substring (uden hensyn til store/små bogstaver)"""
+        needle = title_substring.lower()
+        return [w for w in self.windows() if needle in w.title.lower()]
+
+
+_snapshot = WindowSnapshot()
+
+
+def get_snapshot() -> WindowSnapshot:
+    """Det fælles øjebliksbillede som alle detektorer bruger"""
+    return _snapshot